@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import subprocess
+import tempfile
+import time
+from lxml import etree
+
+import generate_netex
+import netex_queries
+import simple_summary
+import summarise4
+import tracer5
+from netex_index import build_index, find_by_id, find_referring
+from netex_scripts import load_script
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is then left out
+    resource = None
+
+# Times the main entry points over synthetic files of increasing zone count (see generate_netex.py)
+# and reports best wall time and peak RSS per benchmark and size. Runs fully offline.
+# Peak RSS is taken in a fresh interpreter per benchmark: tracemalloc cannot see lxml's C
+# allocations, and in this process earlier benchmarks would already have raised the high water mark.
+# With --baseline the results are compared against a stored run and regressions are flagged.
+# With --check it only confirms the streaming simple_summary parser still gives the DOM parse's csv rows.
+
+
+def measure(fn, repeat=3):
+    # best of a few timed runs
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return seconds
+
+
+def max_rss_bytes():
+    # on Linux ru_maxrss carries over the parent's RSS at fork across exec, so the child would report
+    # at least whatever this process had grown to; VmHWM is the peak of the child's own memory only
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def peak_rss(name, file_path, corpus_dir):
+    # peak RSS of a fresh interpreter running the benchmark once, see --peak_rss. It includes the
+    # interpreter and imports, the same for every benchmark, so compare figures rather than read them alone
+    if resource is None:
+        return None
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--peak_rss', name, file_path, corpus_dir],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def trace_first_stop(file_path):
+    # the same steps as the tracer5 command line, on the first stop in the file
+    tree = etree.parse(file_path)
+    stop_id = tree.find(".//" + tracer5.NETEX + "ScheduledStopPoint").get('id')
+    return tracer5.trace_fare(build_index(tree.getroot()), stop_id)
+
+
+def all_pairs(file_path):
+    tree = etree.parse(file_path)
+    return tracer5.all_pairs_price_matrix(tree, build_index(tree.getroot()))
+
+
+def summarise_directory(directory, parse):
+    return [parse(os.path.join(root, filename)) for root, filename in simple_summary.find_xml_files(directory)]
+
+
+def benchmark_functions(file_path, corpus_dir):
+    explorer_web = load_script('netex-explorer-web.py')
+    explorer_rollup = load_script('netex-explorer-web-rollup.py')
+    return {
+            'summarise4.parse_netex_fares': lambda: summarise4.parse_netex_fares(file_path),
+            'simple_summary.directory': lambda: summarise_directory(corpus_dir, simple_summary.parse_netex_fares),
+            'simple_summary.directory_streaming': lambda: summarise_directory(corpus_dir, simple_summary.parse_netex_fares_streaming),
+            'tracer5.trace': lambda: trace_first_stop(file_path),
+            'tracer5.all_pairs': lambda: all_pairs(file_path),
+            'netex-explorer-web.visualize_tree': lambda: explorer_web.visualize_tree(explorer_web.parse_netex(file_path), start_tag="dataObjects", max_depth=10),
+            'netex-explorer-web-rollup.visualize_tree': lambda: explorer_rollup.visualize_tree(explorer_rollup.parse_netex(file_path), start_tag="dataObjects", max_depth=15, rollup_tags={'Name', 'Description'}, trim_tags=True),
+    }
+
+
+def run_benchmarks(work_dir, sizes, files, repeat):
+    results = {}
+    for zones in sizes:
+        file_path = os.path.join(work_dir, f"zones{zones}.xml")
+        generate_netex.generate_fare_file(file_path, zones=zones)
+        corpus_dir = os.path.join(work_dir, f"corpus{zones}")
+        generate_netex.generate_corpus(corpus_dir, files=files, zones=zones)
+
+        for name, fn in benchmark_functions(file_path, corpus_dir).items():
+            key = f"{name}@zones={zones}"
+            results[key] = {'seconds': measure(fn, repeat), 'peak_rss_bytes': peak_rss(name, file_path, corpus_dir)}
+            memory = f"{results[key]['peak_rss_bytes'] / 1e6:10.2f} MB" if results[key]['peak_rss_bytes'] is not None else ''
+            print(f"{key:<60} {results[key]['seconds'] * 1000:10.1f} ms {memory}")
+    return results
+
+
+def time_per_query(fn, arguments, repeat):
+    # best mean time of one call over all the arguments
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for argument in arguments:
+            fn(argument)
+        elapsed = (time.perf_counter() - start) / len(arguments)
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return seconds
+
+
+def run_query_benchmarks(file_path, repeat, samples=200):
+    """
+    Per lookup cost of the tracer steps three ways: an XPath string built per call (how tracer5
+    used to look things up), the precompiled netex_queries expressions, and the netex_index lookups.
+    """
+    ns = netex_queries.NS
+    tree = etree.parse(file_path)
+    index = build_index(tree.getroot())
+    stop_ids = [stop.get('id') for stop in tree.iter(tracer5.NETEX + 'ScheduledStopPoint')][:samples]
+    zone_ids = [zone.get('id') for zone in tree.iter(tracer5.NETEX + 'FareZone')][:samples]
+    price_group_ids = [group.get('id') for group in tree.iter(tracer5.NETEX + 'PriceGroup')][:samples]
+    distance_matrix_elements = list(tree.iter(tracer5.NETEX + 'DistanceMatrixElement'))[:samples]
+
+    def parent_walk(element):
+        # how tracer5.find_containing_fse used to climb to the FareStructureElement
+        while element is not None and element.tag != tracer5.NETEX + 'FareStructureElement':
+            element = element.getparent()
+        return element
+
+    lookups = {
+        'stop_zone': (stop_ids, {
+            'fstring_xpath': lambda stop_id: tree.xpath(f"//netex:ScheduledStopPointRef[@ref='{stop_id}']/../parent::netex:FareZone", namespaces=ns),
+            'compiled_xpath': lambda stop_id: netex_queries.fare_zones_for_stop(tree, stop_id),
+            'index': lambda stop_id: tracer5.fare_zones_for_stop(stop_id, index),
+        }),
+        'zone_distance_matrix_elements': (zone_ids, {
+            'fstring_xpath': lambda zone_id: tree.xpath(f"//netex:DistanceMatrixElement[netex:StartTariffZoneRef/@ref='{zone_id}']", namespaces=ns),
+            'compiled_xpath': lambda zone_id: netex_queries.distance_matrix_elements(tree, zone_id),
+            'index': lambda zone_id: [ref.getparent() for ref in find_referring(index, zone_id, tracer5.NETEX + 'StartTariffZoneRef')
+                                      if ref.getparent().tag == tracer5.NETEX + 'DistanceMatrixElement'],
+        }),
+        'price_group_amount': (price_group_ids, {
+            'fstring_xpath': lambda group_id: tree.xpath(f"//netex:PriceGroup[@id='{group_id}']//netex:Amount", namespaces=ns),
+            'compiled_xpath': lambda group_id: netex_queries.amount_for_price_group(netex_queries.first(netex_queries.PRICE_GROUP_BY_ID(tree, price_group_id=group_id))),
+            'index': lambda group_id: tracer5.find_amount_for_price_group(find_by_id(index, group_id, tracer5.NETEX + 'PriceGroup')),
+        }),
+        'containing_fare_structure_element': (distance_matrix_elements, {
+            'fstring_xpath': lambda element: element.xpath("ancestor::netex:FareStructureElement[1]", namespaces=ns),
+            'compiled_xpath': netex_queries.containing_fare_structure_element,
+            'parent_walk': parent_walk,
+        }),
+    }
+
+    results = {}
+    for lookup, (arguments, ways) in lookups.items():
+        if not arguments:
+            continue
+        for way, fn in ways.items():
+            key = f"{lookup}.{way}"
+            results[key] = time_per_query(fn, arguments, repeat)
+            print(f"{key:<50} {results[key] * 1e6:10.1f} us/query")
+    return results
+
+
+def check_streaming_summary(work_dir, sizes):
+    """
+    The simple_summary csv row of every file both ways, DOM parse and streaming. Returns
+    [(file_path, row, streaming_row)] for the files where they differ. Covers the sample file in
+    the repo and generated files of each size, with several products, user types and frames.
+    """
+    file_paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RBUS_X4_Outbound_BoostSingle.xml')]
+    for zones in sizes:
+        for options in ({}, {'products': 3, 'user_types': 2, 'frames': 2}, {'stops_per_zone': 1, 'price_groups': 1}):
+            file_path = os.path.join(work_dir, f"check_zones{zones}_{len(file_paths)}.xml")
+            generate_netex.generate_fare_file(file_path, zones=zones, seed=zones, **options)
+            file_paths.append(file_path)
+
+    mismatches = []
+    for file_path in file_paths:
+        root, filename = os.path.split(file_path)
+        row = simple_summary.summary_row(simple_summary.parse_netex_fares(file_path), root, filename)
+        streaming_row = simple_summary.summary_row(simple_summary.parse_netex_fares_streaming(file_path), root, filename)
+        if row != streaming_row:
+            mismatches.append((file_path, row, streaming_row))
+    print(f"{len(file_paths)} files checked, {len(mismatches)} with different summary rows")
+    return mismatches
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ('seconds', 'peak_rss_bytes'):
+            # baselines from before peak RSS was measured have no figure to compare against
+            before, after = baseline[key].get(metric), result[metric]
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append((key, metric, before, after))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the NeTEx tools over synthetic files of increasing size.")
+    parser.add_argument('--sizes', default='10,30,60', help="Comma separated zone counts to generate (default 10,30,60)")
+    parser.add_argument('--files', type=int, default=20, help="Files in the generated directory for the simple_summary run")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark, the best is reported")
+    parser.add_argument('--output', help="Write the results as json to this file")
+    parser.add_argument('--baseline', help="Compare against results previously written with --output")
+    parser.add_argument('--queries', action='store_true', help="Only time the single tracer lookups (built XPath, compiled XPath, index) on a file of each size")
+    parser.add_argument('--check', action='store_true', help="Only check that the streaming simple_summary parser gives the same csv rows as the DOM parse, on the sample file and a generated file of each size")
+    parser.add_argument('--peak_rss', nargs=3, metavar=('NAME', 'FILE', 'CORPUS'), help=argparse.SUPPRESS)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown or memory growth against the baseline (default 0.25)")
+    args = parser.parse_args()
+
+    if args.peak_rss:
+        # the child side of peak_rss: one run of one benchmark, peak RSS printed as json
+        name, file_path, corpus_dir = args.peak_rss
+        fn = benchmark_functions(file_path, corpus_dir)[name]
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        print(json.dumps(max_rss_bytes()))
+        sys.exit(0)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    if args.queries:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for zones in sizes:
+                print(f"zones={zones}")
+                file_path = os.path.join(work_dir, f"zones{zones}.xml")
+                generate_netex.generate_fare_file(file_path, zones=zones)
+                run_query_benchmarks(file_path, args.repeat)
+        sys.exit(0)
+
+    if args.check:
+        with tempfile.TemporaryDirectory() as work_dir:
+            mismatches = check_streaming_summary(work_dir, sizes)
+        for file_path, row, streaming_row in mismatches:
+            print(f"MISMATCH {os.path.basename(file_path)}\n  parse_netex_fares           {row}\n  parse_netex_fares_streaming {streaming_row}")
+        sys.exit(1 if mismatches else 0)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(work_dir, sizes, args.files, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for key, metric, before, after in regressions:
+            print(f"REGRESSION {key} {metric}: {before:.4g} -> {after:.4g}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
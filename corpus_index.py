@@ -0,0 +1,252 @@
+import argparse
+import os
+import sqlite3
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from lxml import etree
+
+import netex_profile
+from netex_profile import count, phase
+from netex_sources import find_netex_files, open_netex, source_exists, source_stat
+
+# A persistent inverted index of a NeTEx corpus in sqlite: which files mention an operator, line,
+# product type, user type, fare zone, stop or topographic place, and at which line of the file.
+#
+#   corpus_index.py build <dirs, files or .zip archives>    add new and changed files, drop deleted ones
+#   corpus_index.py query operator=noc:RBUS                  files mentioning noc:RBUS
+#   corpus_index.py query product_type=singleTrip --list line   lines of the files selling singleTrip products
+#
+# A file is read again only when its size or mtime changed since it was indexed, so rebuilding
+# over an unchanged corpus only stats the files. Queries read only the index, never the XML.
+
+# element -> kind of value; ids and refs of these elements are indexed under the kind
+ELEMENT_KINDS = {
+    'Operator': 'operator', 'OperatorRef': 'operator',
+    'Line': 'line', 'LineRef': 'line',
+    'FareZone': 'fare_zone', 'FareZoneRef': 'fare_zone',
+    'ScheduledStopPoint': 'stop', 'ScheduledStopPointRef': 'stop',
+    'TopographicPlace': 'topographic_place', 'TopographicPlaceRef': 'topographic_place',
+}
+# element -> kind, for the text of these elements
+TEXT_KINDS = {
+    'ProductType': 'product_type',
+    'UserType': 'user_type',
+}
+# (parent, element) -> kind, for text that only means something under that parent
+SCOPED_TEXT_KINDS = {
+    ('Line', 'PublicCode'): 'line',
+    ('Operator', 'PublicCode'): 'operator',
+}
+KINDS = sorted(set(ELEMENT_KINDS.values()) | set(TEXT_KINDS.values()) | set(SCOPED_TEXT_KINDS.values()))
+
+NETEX_NS = '{http://www.netex.org.uk/netex}'
+
+
+def local_name(tag):
+    return tag[len(NETEX_NS):] if tag.startswith(NETEX_NS) else tag
+
+
+def index_file(file_path):
+    """
+    One streaming pass over a file. Returns {(kind, value): [first line, occurrences]}.
+    """
+    postings = {}
+
+    def post(kind, value, line):
+        posting = postings.get((kind, value))
+        if posting is None:
+            postings[(kind, value)] = [line, 1]
+        else:
+            posting[1] += 1
+
+    with open_netex(file_path) as source:
+        for _, elem in etree.iterparse(source, events=('end',)):
+            tag = elem.tag
+            if not isinstance(tag, str):
+                continue
+            tag = local_name(tag)
+            kind = ELEMENT_KINDS.get(tag)
+            if kind is not None:
+                value = elem.get('ref') if tag.endswith('Ref') else elem.get('id')
+                if value:
+                    post(kind, value, elem.sourceline)
+            elif elem.text and elem.text.strip():
+                kind = TEXT_KINDS.get(tag)
+                if kind is None:
+                    parent = elem.getparent()
+                    kind = SCOPED_TEXT_KINDS.get((local_name(parent.tag), tag)) if parent is not None else None
+                if kind is not None:
+                    post(kind, elem.text.strip(), elem.sourceline)
+            # children are done with once their parent closes
+            del elem[:]
+    return postings
+
+
+def timed_index(file_path):
+    started = time.perf_counter()
+    try:
+        return index_file(file_path), None, time.perf_counter() - started
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, etree.XMLSyntaxError) as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - started
+
+
+def open_index(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS files (file_id INTEGER PRIMARY KEY, file_path TEXT UNIQUE, size INTEGER, mtime INTEGER)")
+    # clustered on (kind, value) so a lookup is one range scan
+    conn.execute("CREATE TABLE IF NOT EXISTS postings (kind TEXT, value TEXT, file_id INTEGER, line INTEGER, occurrences INTEGER, "
+                 "PRIMARY KEY (kind, value, file_id)) WITHOUT ROWID")
+    conn.execute("CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id)")
+    conn.commit()
+    return conn
+
+
+def remove_file(conn, file_id):
+    conn.execute("DELETE FROM postings WHERE file_id = ?", (file_id,))
+    conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+
+def write_file_postings(conn, file_path, fingerprint, postings):
+    # replaces whatever the index held for the file
+    row = conn.execute("SELECT file_id FROM files WHERE file_path = ?", (file_path,)).fetchone()
+    if row is not None:
+        remove_file(conn, row[0])
+    file_id = conn.execute("INSERT INTO files (file_path, size, mtime) VALUES (?, ?, ?)", (file_path, *fingerprint)).lastrowid
+    conn.executemany("INSERT INTO postings (kind, value, file_id, line, occurrences) VALUES (?, ?, ?, ?, ?)",
+                     [(kind, value, file_id, line, occurrences) for (kind, value), (line, occurrences) in postings.items()])
+
+
+def build_index(conn, paths, workers=1, batch=100):
+    """
+    Bring the index up to date with the NeTEx files under paths.
+    Returns (indexed, unchanged, removed, failed) file counts.
+    """
+    with phase('scan'):
+        file_paths = [os.path.abspath(os.path.join(root, filename)) for path in paths for root, filename in find_netex_files(path)]
+        known = {file_path: (file_id, (size, mtime)) for file_id, file_path, size, mtime in conn.execute("SELECT file_id, file_path, size, mtime FROM files")}
+        fingerprints = {file_path: source_stat(file_path) for file_path in file_paths}
+        to_index = [file_path for file_path in file_paths if file_path not in known or known[file_path][1] != fingerprints[file_path]]
+
+    # files indexed earlier that are no longer on disk, files outside paths that still exist are kept
+    removed = 0
+    with conn:
+        for file_path, (file_id, _) in known.items():
+            if file_path not in fingerprints and not source_exists(file_path):
+                remove_file(conn, file_id)
+                removed += 1
+
+    failed = 0
+    with phase('index'), ExitStack() as pool:
+        if workers > 1:
+            executor = pool.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = executor.map(timed_index, to_index, chunksize=max(1, len(to_index) // (workers * 8)))
+        else:
+            results = map(timed_index, to_index)
+        pending = 0
+        for file_path, (postings, error, seconds) in zip(to_index, results):
+            netex_profile.record_file(file_path, seconds)
+            if postings is None:
+                print(f"Skipped {file_path}: {error}")
+                failed += 1
+                continue
+            write_file_postings(conn, file_path, fingerprints[file_path], postings)
+            count('postings', len(postings))
+            pending += 1
+            if pending >= batch:
+                conn.commit()
+                pending = 0
+        conn.commit()
+    count('files', len(file_paths))
+    return len(to_index) - failed, len(file_paths) - len(to_index), removed, failed
+
+
+def query_index(conn, terms):
+    """
+    Files matching every (kind, value) term, as (file_path, [(kind, value, line, occurrences)]) in path order.
+    A value ending in * matches any value starting with the rest.
+    """
+    matches = None
+    for kind, value in terms:
+        if value.endswith('*'):
+            prefix = value[:-1]
+            # a range on the primary key rather than LIKE, which sqlite would not use the key for
+            rows = conn.execute("SELECT file_id, value, line, occurrences FROM postings WHERE kind = ? AND value >= ? AND value < ?",
+                                (kind, prefix, prefix + '\U0010ffff'))
+        else:
+            rows = conn.execute("SELECT file_id, value, line, occurrences FROM postings WHERE kind = ? AND value = ?", (kind, value))
+        found = {}
+        for file_id, found_value, line, occurrences in rows:
+            found.setdefault(file_id, []).append((kind, found_value, line, occurrences))
+        if matches is None:
+            matches = found
+        else:
+            matches = {file_id: hits + found[file_id] for file_id, hits in matches.items() if file_id in found}
+        if not matches:
+            return []
+
+    selected_table(conn, 'selected_ids', list(matches))
+    paths = dict(conn.execute("SELECT f.file_id, f.file_path FROM selected_ids s JOIN files f ON f.file_id = s.value"))
+    return sorted((paths[file_id], hits) for file_id, hits in matches.items())
+
+
+def selected_table(conn, name, values):
+    # a temporary table of values to join against, an IN list would hit sqlite's limit on parameters
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {name} (value PRIMARY KEY)")
+    conn.execute(f"DELETE FROM {name}")
+    conn.executemany(f"INSERT OR IGNORE INTO {name} (value) VALUES (?)", [(value,) for value in values])
+
+
+def values_in_files(conn, kind, file_paths):
+    # the distinct values of one kind in the given files, with the number of those files using each
+    selected_table(conn, 'selected_paths', file_paths)
+    return conn.execute("SELECT p.value, COUNT(*) FROM selected_paths s JOIN files f ON f.file_path = s.value "
+                        "JOIN postings p ON p.file_id = f.file_id AND p.kind = ? GROUP BY p.value ORDER BY p.value", (kind,)).fetchall()
+
+
+def parse_term(text):
+    kind, separator, value = text.partition('=')
+    if not separator or kind not in KINDS or not value:
+        raise argparse.ArgumentTypeError(f"{text!r} is not kind=value with kind one of {', '.join(KINDS)}")
+    return kind, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query an inverted index of which NeTEx files mention which operators, lines, products, zones and stops.")
+    parser.add_argument('--db', default='corpus_index.sqlite', help="Index database (default corpus_index.sqlite)")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Index new and changed files, forget deleted ones")
+    build.add_argument('paths', nargs='+', help="Netex files, directories or .zip archives")
+    build.add_argument('--workers', type=int, default=1, help="Number of processes to read files with (default 1)")
+    build.add_argument('--batch', type=int, default=100, help="Files per commit (default 100)")
+
+    query = commands.add_parser('query', help="List the files matching every term")
+    query.add_argument('terms', nargs='+', type=parse_term, help=f"kind=value, kind one of {', '.join(KINDS)}; a trailing * matches a prefix")
+    query.add_argument('--list', choices=KINDS, help="Instead of the files, list the values of this kind in the matching files")
+    query.add_argument('--lines', action='store_true', help="Show the line and number of occurrences of each term in each file")
+
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    conn = open_index(args.db)
+    if args.command == 'build':
+        indexed, unchanged, removed, failed = build_index(conn, args.paths, args.workers, args.batch)
+        print(f"{indexed} files indexed, {unchanged} unchanged, {removed} removed, {failed} skipped")
+    else:
+        with phase('query'):
+            results = query_index(conn, args.terms)
+        if args.list:
+            for value, files in values_in_files(conn, args.list, [file_path for file_path, _ in results]) if results else []:
+                print(f"{value}\t{files} files")
+        else:
+            for file_path, hits in results:
+                print(file_path)
+                if args.lines:
+                    for kind, value, line, occurrences in hits:
+                        print(f"  {kind}={value} line {line}, {occurrences} occurrences")
+        count('files', len(results))
+    conn.close()
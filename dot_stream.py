@@ -0,0 +1,58 @@
+from graphviz import Digraph
+
+# A graphviz Digraph that writes each statement to a file as it is added instead of keeping the
+# whole graph in body and building one string with .source at the end. Quoting and layout of the
+# lines are the Digraph's own, so the file is the same as writing graph.source would have been.
+#
+#   with open('graph.dot', 'w') as f:
+#       graph = StreamingDigraph(f)
+#       graph.node('a', 'A')        # written straight away
+#       graph.close()               # writes the closing brace
+#
+# Graph, node and edge defaults given to the constructor go in the head; attr() statements made
+# later are written where they are made, as Digraph.attr would have placed them in body.
+
+
+class StreamedBody:
+    # stands in for Digraph.body, which only ever appends to it
+
+    def __init__(self, file):
+        self.file = file
+        self.lines = 0
+
+    def append(self, line):
+        self.file.write(line)
+        self.lines += 1
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return self.lines
+
+
+class StreamingDigraph(Digraph):
+    def __init__(self, file, **kwargs):
+        super().__init__(**kwargs)
+        self.file = file
+        self.body = StreamedBody(file)
+        # everything but the closing brace, the body is empty so far
+        head = list(super().__iter__())[:-1]
+        file.write(''.join(head))
+        self.closed = False
+
+    @property
+    def source(self):
+        raise TypeError("a StreamingDigraph has already been written to its file, it has no source")
+
+    def close(self):
+        if not self.closed:
+            self.file.write(self._tail)
+            self.file.flush()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import os
+import sys
+import numpy as np
+from lxml import etree
+
+from netex_index import build_index, find_by_id
+from netex_sources import open_netex, source_stat, split_archive_path
+from tracer5 import NETEX, stop_zone_memberships
+
+# Compiles a NeTEx fares file once into a small .npz lookup artifact
+#   stop -> zones           member_starts / member_zones, one slice of zone numbers per stop
+#   zone pair -> group      zone_group[start, end] into group_ids, -1 for no price group
+#   price group -> amount   group_amounts in pence, -1 for no amount
+# so stop pair prices can be answered without parsing the XML again. The artifact keeps the size
+# and mtime of the source file and is rebuilt by load_lookup as soon as the source changes.
+# The first DistanceMatrixElement in the document wins for a zone pair, as in tracer5.
+
+LOOKUP_VERSION = 1
+MISSING = -1
+NO_ELEMENT = np.iinfo(np.int32).max
+
+
+def artifact_path_for(file_path):
+    archive, member = split_archive_path(file_path)
+    if member is not None:
+        # a zip member keeps its lookup next to the archive
+        return f"{archive}.{member.replace('/', '_')}.lookup.npz"
+    return file_path + '.lookup.npz'
+
+
+def source_fingerprint(file_path):
+    return [LOOKUP_VERSION, *source_stat(file_path)]
+
+
+def compile_lookup(file_path, artifact_path=None):
+    artifact_path = artifact_path or artifact_path_for(file_path)
+    with open_netex(file_path) as source:
+        tree = etree.parse(source)
+    index = build_index(tree.getroot())
+    stop_ids, _, zone_ids, member_stop, member_zone = stop_zone_memberships(tree, index)
+
+    # memberships grouped by stop, in the order they were found
+    by_stop = np.argsort(np.asarray(member_stop, dtype=np.intp), kind='stable')
+    member_zones = np.asarray(member_zone, dtype=np.int32)[by_stop]
+    member_starts = np.zeros(len(stop_ids) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(np.asarray(member_stop, dtype=np.intp), minlength=len(stop_ids)), out=member_starts[1:])
+
+    n_zones = len(zone_ids)
+    zone_order = np.full((n_zones, n_zones), NO_ELEMENT, dtype=np.int32)
+    zone_group = np.full((n_zones, n_zones), MISSING, dtype=np.int32)
+    group_ids = {}
+    group_amounts = []
+    for order, element in enumerate(tree.iter(NETEX + 'DistanceMatrixElement')):
+        start_ref = element.find(NETEX + 'StartTariffZoneRef')
+        end_ref = element.find(NETEX + 'EndTariffZoneRef')
+        if start_ref is None or end_ref is None:
+            continue
+        start = zone_ids.get(start_ref.get('ref'))
+        end = zone_ids.get(end_ref.get('ref'))
+        if start is None or end is None or zone_order[start, end] != NO_ELEMENT:
+            continue
+        zone_order[start, end] = order
+
+        price_group_ref = element.find(".//" + NETEX + "PriceGroupRef")
+        price_group = find_by_id(index, price_group_ref.get('ref'), NETEX + 'PriceGroup') if price_group_ref is not None else None
+        if price_group is None:
+            continue
+        group = group_ids.get(price_group.get('id'))
+        if group is None:
+            group = group_ids[price_group.get('id')] = len(group_amounts)
+            amount = price_group.find(".//" + NETEX + "Amount")
+            group_amounts.append(int(round(float(amount.text) * 100)) if amount is not None and amount.text else MISSING)
+        zone_group[start, end] = group
+
+    # write to the side and swap in, a query never sees half an artifact
+    tmp_path = artifact_path + '.tmp.npz'
+    np.savez(tmp_path,
+             fingerprint=np.array(source_fingerprint(file_path), dtype=np.int64),
+             stop_ids=np.array(stop_ids), zone_ids=np.array(list(zone_ids)),
+             member_starts=member_starts, member_zones=member_zones,
+             zone_order=zone_order, zone_group=zone_group,
+             group_ids=np.array(list(group_ids)), group_amounts=np.array(group_amounts, dtype=np.int32))
+    os.replace(tmp_path, artifact_path)
+    return artifact_path
+
+
+def load_lookup(file_path, artifact_path=None):
+    """
+    Load the lookup artifact for a NeTEx file, compiling it first if it is missing or older than the file.
+    """
+    artifact_path = artifact_path or artifact_path_for(file_path)
+    lookup = None
+    if os.path.exists(artifact_path):
+        with np.load(artifact_path) as artifact:
+            if artifact['fingerprint'].tolist() == source_fingerprint(file_path):
+                lookup = {name: artifact[name] for name in artifact.files}
+    if lookup is None:
+        compile_lookup(file_path, artifact_path)
+        with np.load(artifact_path) as artifact:
+            lookup = {name: artifact[name] for name in artifact.files}
+
+    # plain lists and a dict for the per query work, numpy scalar access is slower than list indexing
+    lookup['stop_index'] = {stop_id: i for i, stop_id in enumerate(lookup['stop_ids'].tolist())}
+    lookup['member_starts'] = lookup['member_starts'].tolist()
+    lookup['member_zones'] = lookup['member_zones'].tolist()
+    lookup['group_ids'] = lookup['group_ids'].tolist()
+    lookup['group_amounts'] = lookup['group_amounts'].tolist()
+    return lookup
+
+
+def query_price(lookup, start_stop_id, end_stop_id):
+    """
+    Price from one stop to another as (amount in pence or None, price group id, start zone id, end zone id),
+    or None if the stops are unknown or no DistanceMatrixElement links their zones.
+    """
+    start = lookup['stop_index'].get(start_stop_id)
+    end = lookup['stop_index'].get(end_stop_id)
+    if start is None or end is None:
+        return None
+    member_starts, member_zones, zone_order = lookup['member_starts'], lookup['member_zones'], lookup['zone_order']
+
+    best = None
+    for start_zone in member_zones[member_starts[start]:member_starts[start + 1]]:
+        for end_zone in member_zones[member_starts[end]:member_starts[end + 1]]:
+            order = zone_order[start_zone, end_zone]
+            if order != NO_ELEMENT and (best is None or order < best[0]):
+                best = (order, start_zone, end_zone)
+    if best is None:
+        return None
+
+    _, start_zone, end_zone = best
+    group = int(lookup['zone_group'][start_zone, end_zone])
+    zone_ids = lookup['zone_ids']
+    if group == MISSING:
+        return None, None, str(zone_ids[start_zone]), str(zone_ids[end_zone])
+    amount = lookup['group_amounts'][group]
+    return (amount if amount != MISSING else None), lookup['group_ids'][group], str(zone_ids[start_zone]), str(zone_ids[end_zone])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a NeTEx fares file into a binary lookup and answer stop to stop price queries from it.")
+    parser.add_argument('file_path', help="Netex fares XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('stops', nargs='*', help="Start and end stop id pairs to price")
+    parser.add_argument('--artifact', help="Lookup file to use (default <file_path>.lookup.npz)")
+    parser.add_argument('--pairs', help="Csv file of start_stop,end_stop rows to price, - for stdin")
+    parser.add_argument('--compile', action='store_true', help="Rebuild the lookup even if it is up to date")
+    args = parser.parse_args()
+
+    if len(args.stops) % 2:
+        parser.error("stops must be given as start and end pairs")
+
+    if args.compile:
+        print(f"Compiled {compile_lookup(args.file_path, args.artifact)}")
+    lookup = load_lookup(args.file_path, args.artifact)
+
+    pairs = list(zip(args.stops[::2], args.stops[1::2]))
+    if args.pairs:
+        source = sys.stdin if args.pairs == '-' else open(args.pairs, newline='')
+        pairs.extend((row[0], row[1]) for row in csv.reader(source) if len(row) >= 2)
+
+    writer = csv.writer(sys.stdout)
+    if pairs:
+        writer.writerow(['start_stop', 'end_stop', 'amount', 'price_group', 'start_zone', 'end_zone'])
+    for start_stop_id, end_stop_id in pairs:
+        result = query_price(lookup, start_stop_id, end_stop_id)
+        if result is None:
+            writer.writerow([start_stop_id, end_stop_id, '', '', '', ''])
+            continue
+        amount, price_group_id, start_zone_id, end_zone_id = result
+        writer.writerow([start_stop_id, end_stop_id, '' if amount is None else f"{amount / 100:.2f}", price_group_id or '', start_zone_id, end_zone_id])
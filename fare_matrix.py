@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import re
+import numpy as np
+from lxml import etree
+
+from netex_index import build_index
+from netex_sources import open_netex, relative_source_name
+from tracer5 import NETEX, price_for_distance_matrix
+
+# Exports the fare triangle of each FareStructureElement as a dense int32 matrix of pence,
+# rows are start zones and columns end zones, MISSING where no DistanceMatrixElement covers the pair.
+# Each triangle is a plain .npy file, so np.load(..., mmap_mode='r') opens it without reading it,
+# next to <name>_start_zones.npy and <name>_end_zones.npy holding the zone ids for rows and columns.
+# index.json in the output directory lists every exported triangle by source file and element id.
+
+MISSING = -1
+
+
+def safe_name(element_id):
+    # NeTEx ids carry ':' and '@', keep file names portable
+    return re.sub(r'[^\w.+-]', '_', element_id)
+
+
+def fare_triangles(tree, index):
+    """
+    Yield (fare structure element id, prices, start_zone_ids, end_zone_ids) for every
+    FareStructureElement with DistanceMatrixElements. Zones are numbered in order of first use and,
+    as in the tracer, the first DistanceMatrixElement in the document wins for a zone pair.
+    An element without an id is named FareStructureElement_<n> after its position in the file.
+    """
+    for position, fse in enumerate(tree.iter(NETEX + 'FareStructureElement')):
+        start_zones, end_zones, cells = {}, {}, {}
+        for element in fse.iter(NETEX + 'DistanceMatrixElement'):
+            start_ref = element.find(NETEX + 'StartTariffZoneRef')
+            end_ref = element.find(NETEX + 'EndTariffZoneRef')
+            if start_ref is None or end_ref is None:
+                continue
+            start = start_zones.setdefault(start_ref.get('ref'), len(start_zones))
+            end = end_zones.setdefault(end_ref.get('ref'), len(end_zones))
+            if (start, end) in cells:
+                continue
+            price = price_for_distance_matrix(element, index)
+            cells[(start, end)] = MISSING if price is None else int(round(price * 100))
+        if not cells:
+            continue
+
+        prices = np.full((len(start_zones), len(end_zones)), MISSING, dtype=np.int32)
+        rows, columns = zip(*cells)
+        prices[list(rows), list(columns)] = list(cells.values())
+        yield fse.get('id') or f"FareStructureElement_{position}", prices, list(start_zones), list(end_zones)
+
+
+def export_fare_matrices(file_path, output_dir):
+    """
+    Write the fare triangles of one NeTEx file into output_dir and return their index entries.
+    """
+    with open_netex(file_path) as source:
+        tree = etree.parse(source)
+    index = build_index(tree.getroot())
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries = {}
+    # ids differing only in punctuation (a:b, a@b) or case share a safe_name, the later ones get a suffix;
+    # all three files of a triangle are claimed, so an id ending in _start_zones cannot overwrite one either
+    used = set()
+    suffixes = ('.npy', '_start_zones.npy', '_end_zones.npy')
+    for fse_id, prices, start_zone_ids, end_zone_ids in fare_triangles(tree, index):
+        name = base = safe_name(fse_id)
+        n = 1
+        while any(name.lower() + suffix in used for suffix in suffixes):
+            n += 1
+            name = f"{base}_{n}"
+        used.update(name.lower() + suffix for suffix in suffixes)
+        matrix = np.lib.format.open_memmap(os.path.join(output_dir, name + '.npy'), mode='w+', dtype=np.int32, shape=prices.shape)
+        matrix[:] = prices
+        matrix.flush()
+        del matrix
+        np.save(os.path.join(output_dir, name + '_start_zones.npy'), np.array(start_zone_ids))
+        np.save(os.path.join(output_dir, name + '_end_zones.npy'), np.array(end_zone_ids))
+        entries[fse_id] = {'matrix': name + '.npy', 'shape': list(prices.shape)}
+    return entries
+
+
+def open_fare_matrix(matrix_path):
+    """
+    Open an exported triangle read-only and memory-mapped.
+    Returns (prices, start_zone_index, end_zone_index) with the indexes mapping zone id -> row / column.
+    """
+    base = re.sub(r'\.npy$', '', matrix_path)
+    prices = np.load(matrix_path, mmap_mode='r')
+    start_zone_ids = np.load(base + '_start_zones.npy')
+    end_zone_ids = np.load(base + '_end_zones.npy')
+    return prices, {zone_id: i for i, zone_id in enumerate(start_zone_ids.tolist())}, {zone_id: i for i, zone_id in enumerate(end_zone_ids.tolist())}
+
+
+def lookup_prices(prices, start_zone_index, end_zone_index, start_zone_ids, end_zone_ids):
+    # vectorised lookup of many zone pairs at once, MISSING for unknown zones or uncovered pairs
+    rows = np.array([start_zone_index.get(zone_id, -1) for zone_id in start_zone_ids], dtype=np.intp)
+    columns = np.array([end_zone_index.get(zone_id, -1) for zone_id in end_zone_ids], dtype=np.intp)
+    known = (rows >= 0) & (columns >= 0)
+    result = np.full(len(rows), MISSING, dtype=np.int32)
+    result[known] = prices[rows[known], columns[known]]
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the fare triangles of NeTEx files as memory-mappable numpy matrices of pence.")
+    parser.add_argument('file_paths', nargs='+', help="Netex fares XML files, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('-o', '--output_dir', default='fare_matrices', help="Directory to write the matrices and index.json to (default fare_matrices)")
+    args = parser.parse_args()
+
+    # one sub directory per source file, index.json is updated so several runs can share a directory
+    index_path = os.path.join(args.output_dir, 'index.json')
+    matrix_index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            matrix_index = json.load(f)
+
+    # sub directories are named after the path below the inputs' common directory, so files of the same
+    # name in different directories do not overwrite each other nor the files of an earlier run; a file
+    # exported again keeps its sub directory
+    used = {os.path.dirname(entry['matrix']): source for source, entries in matrix_index.items() for entry in entries.values()}
+    previous = {source: name for name, source in used.items()}
+    common = os.path.commonpath([os.path.dirname(os.path.abspath(file_path)) for file_path in args.file_paths])
+
+    for file_path in args.file_paths:
+        source = os.path.abspath(file_path)
+        name = base = previous.get(source) or relative_source_name(source, common)
+        n = 1
+        while used.get(name, source) != source:
+            n += 1
+            name = f"{base}_{n}"
+        used[name] = source
+        entries = export_fare_matrices(file_path, os.path.join(args.output_dir, name))
+        for entry in entries.values():
+            entry['matrix'] = os.path.join(name, entry['matrix'])
+        matrix_index[source] = entries
+        print(f"{file_path}: {len(entries)} fare triangles")
+
+    with open(index_path, 'w') as f:
+        json.dump(matrix_index, f, indent=2)
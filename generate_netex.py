@@ -0,0 +1,292 @@
+import argparse
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+# Writes synthetic NeTEx fare files shaped like the UK fares profile files we get from operators
+# (see RBUS_X4_Outbound_BoostSingle.xml): stops and a line, boarding and alighting FareZones,
+# one Tariff holding a zone to zone fare triangle, products per user type, price groups,
+# fare tables and a set of shared UK common resource frames.
+#
+# The fare triangle has zones * (zones + 1) / 2 DistanceMatrixElements, so file size grows
+# with the square of the zone count.
+
+NETEX_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n<PublicationDelivery version="1.1" xmlns="http://www.netex.org.uk/netex">\n'
+
+USER_TYPES = ['adult', 'child', 'youngPerson', 'senior', 'student', 'infant', 'anyone']
+
+
+class XmlWriter:
+    def __init__(self, file):
+        self.file = file
+        self.depth = 0
+
+    def open(self, tag, **attrib):
+        self.file.write('  ' * self.depth + f"<{tag}{self.attributes(attrib)}>\n")
+        self.depth += 1
+
+    def close(self, tag):
+        self.depth -= 1
+        self.file.write('  ' * self.depth + f"</{tag}>\n")
+
+    def leaf(self, tag, text=None, **attrib):
+        if text is None:
+            self.file.write('  ' * self.depth + f"<{tag}{self.attributes(attrib)} />\n")
+        else:
+            self.file.write('  ' * self.depth + f"<{tag}{self.attributes(attrib)}>{escape(str(text))}</{tag}>\n")
+
+    @staticmethod
+    def attributes(attrib):
+        return ''.join(f" {key}={quoteattr(str(value))}" for key, value in attrib.items())
+
+
+def generate_fare_file(file_path, zones=20, stops_per_zone=3, products=1, user_types=1, price_groups=4, frames=1, operator='GEN', line='1', seed=0):
+    rng = random.Random(seed)
+    line_id = f"{operator}:PH0000000:1:{line}"
+    zone_codes = [f"{i + 1:03d}" for i in range(zones)]
+    stops = {code: [f"atco:{operator}{code}{s:03d}" for s in range(stops_per_zone)] for code in zone_codes}
+    prices = [round(1.0 + 0.1 * i, 2) for i in range(price_groups)]
+    users = [USER_TYPES[i % len(USER_TYPES)] + (str(i // len(USER_TYPES)) if i >= len(USER_TYPES) else '') for i in range(user_types)]
+    product_names = [f"Product{p + 1}" for p in range(products)]
+
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(NETEX_HEADER)
+        w = XmlWriter(f)
+        w.depth = 1
+        w.leaf('PublicationTimestamp', '2024-10-29T12:03:07Z')
+        w.leaf('ParticipantRef', 'SYS001')
+        w.leaf('Description', f"Synthetic fares for {operator} line {line}")
+        w.open('dataObjects')
+        w.open('CompositeFrame', version='1.0', id=f"epd:UK:{operator}:CompositeFrame_UK_PI_LINE_FARE_OFFER:{line_id}:op", dataSourceRef='data_source', responsibilitySetRef='tariffs')
+        w.leaf('Name', f"Fares for Line {line}")
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_LINE_FARE_OFFER:FXCP')
+        w.open('frames')
+
+        # operator resources
+        w.open('ResourceFrame', version='1.0', id=f"epd:UK:{operator}:ResourceFrame_UK_PI_COMMON:op")
+        w.leaf('Name', 'Operator specific common resources')
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_COMMON:FXCP', version='fxc:v1.0')
+        w.open('dataSources')
+        w.open('DataSource', id='data_source', version='1.0')
+        w.leaf('Email', 'TODO')
+        w.close('DataSource')
+        w.close('dataSources')
+        w.open('organisations')
+        w.open('Operator', version='1.0', id=f"noc:{operator}")
+        w.leaf('PublicCode', operator)
+        w.leaf('Name', f"{operator} Buses")
+        w.close('Operator')
+        w.close('organisations')
+        w.close('ResourceFrame')
+
+        # line and stops
+        w.open('ServiceFrame', version='1.0', id=f"epd:UK:{operator}:ServiceFrame_UK_PI_NETWORK:{line_id}:op")
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_NETWORK:FXCP')
+        w.open('lines')
+        w.open('Line', version='1.0', id=line_id)
+        w.leaf('Name', f"{operator} {line}")
+        w.leaf('PublicCode', line)
+        w.leaf('OperatorRef', ref=f"noc:{operator}", version='1.0')
+        w.leaf('LineType', 'local')
+        w.close('Line')
+        w.close('lines')
+        w.open('scheduledStopPoints')
+        for code in zone_codes:
+            for stop_id in stops[code]:
+                w.open('ScheduledStopPoint', version='any', id=stop_id)
+                w.leaf('Name', f"Stop {stop_id}")
+                w.open('TopographicPlaceView')
+                w.leaf('TopographicPlaceRef', ref=f"nptgLocality:E{code}", version='any')
+                w.close('TopographicPlaceView')
+                w.close('ScheduledStopPoint')
+        w.close('scheduledStopPoints')
+        w.close('ServiceFrame')
+
+        # fare zones, one boarding and one alighting zone per fare stage
+        w.open('FareFrame', version='1.0', id=f"epd:UK:{operator}:FareFrame_UK_PI_FARE_NETWORK:{line_id}:op")
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_NETWORK:FXCP')
+        w.open('fareZones')
+        for direction in ('boarding', 'alighting'):
+            for code in zone_codes:
+                w.open('FareZone', id=f"fs@{code}@{direction}", version='1.0')
+                w.leaf('Name', f"Fare stage {code}")
+                w.open('members')
+                for stop_id in stops[code]:
+                    w.leaf('ScheduledStopPointRef', f"Stop {stop_id}", ref=stop_id, version='any')
+                w.close('members')
+                w.close('FareZone')
+        w.close('fareZones')
+        w.close('FareFrame')
+
+        # tariff with the fare triangle, and the products
+        w.open('FareFrame', version='1.0', id=f"epd:UK:{operator}:FareFrame_UK_PI_FARE_PRODUCT:{line_id}:op", dataSourceRef='data_source', responsibilitySetRef='tariffs')
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_FARE_PRODUCT:FXCP', version='fxc:v1.0')
+        w.open('tariffs')
+        w.open('Tariff', id=f"Tariff@{line_id}", version='1.0')
+        w.leaf('Name', f"{operator} {line} fares")
+        w.leaf('OperatorRef', version='1.0', ref=f"noc:{operator}")
+        w.leaf('LineRef', ref=line_id, version='1.0')
+        w.leaf('TypeOfTariffRef', version='fxc:v1.0', ref='fxc:point_to_point')
+        w.leaf('TariffBasis', 'pointToPoint')
+        w.open('fareStructureElements')
+        w.open('FareStructureElement', id='Tariff@access', version='1.0')
+        w.leaf('Name', f"O/D pairs for Line {line}")
+        w.leaf('TypeOfFareStructureElementRef', ref='fxc:access', version='fxc:v1.0')
+        w.open('distanceMatrixElements')
+        for i, start in enumerate(zone_codes):
+            for end in zone_codes[i:]:
+                price_group = rng.randrange(price_groups)
+                w.open('DistanceMatrixElement', id=f"{start}+{end}", version='1.0')
+                w.open('priceGroups')
+                w.leaf('PriceGroupRef', version='1.0', ref=f"price_band_{prices[price_group]}")
+                w.close('priceGroups')
+                w.leaf('StartTariffZoneRef', version='1.0', ref=f"fs@{start}@boarding")
+                w.leaf('EndTariffZoneRef', version='1.0', ref=f"fs@{end}@alighting")
+                w.close('DistanceMatrixElement')
+        w.close('distanceMatrixElements')
+        w.close('FareStructureElement')
+        w.open('FareStructureElement', id='Tariff@eligibility', version='1.0')
+        w.leaf('Name', 'Eligible user types')
+        w.leaf('TypeOfFareStructureElementRef', version='fxc:v1.0', ref='fxc:eligibility')
+        w.open('GenericParameterAssignment', order='1', id='Tariff@eligibility', version='1.0')
+        w.leaf('LimitationGroupingType', 'XOR')
+        w.open('limitations')
+        for user in users:
+            w.open('UserProfile', version='1.0', id=f"UserProfile:{user}")
+            w.leaf('Name', user)
+            w.leaf('UserType', user)
+            w.close('UserProfile')
+        w.close('limitations')
+        w.close('GenericParameterAssignment')
+        w.close('FareStructureElement')
+        w.open('FareStructureElement', id='Tariff@conditions_of_travel', version='1.0')
+        w.leaf('Name', 'Conditions of travel')
+        w.leaf('TypeOfFareStructureElementRef', version='fxc:v1.0', ref='fxc:travel_conditions')
+        w.open('GenericParameterAssignment', version='1.0', order='1', id='Tariff@conditions_of_travel')
+        w.open('limitations')
+        w.open('RoundTrip', version='1.0', id='Trip@travel@condition@direction')
+        w.leaf('TripType', 'single')
+        w.close('RoundTrip')
+        w.close('limitations')
+        w.close('GenericParameterAssignment')
+        w.close('FareStructureElement')
+        w.close('fareStructureElements')
+        w.close('Tariff')
+        w.close('tariffs')
+        w.open('fareProducts')
+        for name in product_names:
+            w.open('PreassignedFareProduct', id=f"Trip@{name}", version='1.0')
+            w.leaf('Name', name)
+            w.leaf('OperatorRef', version='1.0', ref=f"noc:{operator}")
+            w.open('ConditionSummary')
+            w.leaf('FareStructureType', 'zonalFare')
+            w.close('ConditionSummary')
+            w.open('validableElements')
+            w.open('ValidableElement', id=f"Trip@{name}@travel", version='1.0')
+            w.open('fareStructureElements')
+            w.leaf('FareStructureElementRef', version='1.0', ref='Tariff@access')
+            w.leaf('FareStructureElementRef', version='1.0', ref='Tariff@conditions_of_travel')
+            w.close('fareStructureElements')
+            w.close('ValidableElement')
+            w.close('validableElements')
+            w.leaf('ProductType', 'singleTrip')
+            w.close('PreassignedFareProduct')
+        w.close('fareProducts')
+        w.close('FareFrame')
+
+        # prices, and a fare table per product and user type
+        w.open('FareFrame', version='1.0', id=f"epd:UK:{operator}:FareFrame_UK_PI_FARE_PRICE:{line_id}:op", dataSourceRef='data_source', responsibilitySetRef='tariffs')
+        w.leaf('TypeOfFrameRef', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_FARE_PRICE:FXCP', version='fxc:v1.0')
+        w.open('priceGroups')
+        for price in prices:
+            w.open('PriceGroup', id=f"price_band_{price}", version='1.0')
+            w.open('members')
+            w.open('GeographicalIntervalPrice', version='1.0', id=f"price_band_{price}@{line}")
+            w.leaf('Amount', price)
+            w.close('GeographicalIntervalPrice')
+            w.close('members')
+            w.close('PriceGroup')
+        w.close('priceGroups')
+        w.open('fareTables')
+        for name in product_names:
+            for user in users:
+                w.open('FareTable', id=f"Trip@{name}@{user}@{line_id}", version='1.0')
+                w.leaf('Name', f"{name} {user}")
+                w.open('pricesFor')
+                w.leaf('PreassignedFareProductRef', version='1.0', ref=f"Trip@{name}")
+                w.leaf('UserProfileRef', ref=f"UserProfile:{user}", version='1.0')
+                w.close('pricesFor')
+                w.open('columns')
+                for order, code in enumerate(zone_codes, start=1):
+                    w.open('FareTableColumn', id=f"Trip@{name}@{user}@c{order}@{code}", version='1.0', order=order)
+                    w.open('representing')
+                    w.leaf('FareZoneRef', version='1.0', ref=f"fs@{code}@boarding")
+                    w.close('representing')
+                    w.close('FareTableColumn')
+                w.close('columns')
+                w.close('FareTable')
+        w.close('fareTables')
+        w.close('FareFrame')
+        w.close('frames')
+        w.close('CompositeFrame')
+
+        # UK common resources, the same boilerplate every operator file carries; further copies get
+        # suffixed ids so no id is defined twice, the refs resolve to the first
+        for frame in range(frames):
+            suffix = '' if frame == 0 else str(frame)
+            w.open('CompositeFrame', version='fxc:v1.0', id=f"fxc:UK:DFT:TypeOfFrame_UK_PI_METADATA_OFFER:FXCP:fxc{suffix}", dataSourceRef='fxc:common')
+            w.leaf('TypeOfFrameRef', version='fxc:v1.0', ref='fxc:UK:DFT:TypeOfFrame_UK_PI_METADATA_OFFER:FXCP:fxc')
+            w.open('frames')
+            w.open('ResourceFrame', version='fxc:v1.0', id=f"fxc:UK:DFT:ResourceFrame_UK_PI_COMMON:FXCP{suffix}")
+            w.leaf('Name', 'UK common resources')
+            w.open('typesOfValue')
+            for type_of_frame in ('UK_PI_METADATA_OFFER', 'UK_PI_LINE_FARE_OFFER', 'UK_PI_COMMON', 'UK_PI_NETWORK', 'UK_PI_FARE_NETWORK', 'UK_PI_FARE_PRODUCT', 'UK_PI_FARE_PRICE'):
+                w.open('TypeOfFrame', version='fxc:v1.0', id=f"fxc:UK:DFT:TypeOfFrame_{type_of_frame}:FXCP{suffix}")
+                w.leaf('Name', type_of_frame)
+                w.close('TypeOfFrame')
+            for type_of_product in ('standard_product@trip@single', 'standard_product@trip@return', 'standard_product@pass@period'):
+                w.open('TypeOfFareProduct', version='fxc:v1.0', id=f"fxc:{type_of_product}{suffix}")
+                w.leaf('Name', type_of_product)
+                w.close('TypeOfFareProduct')
+            w.close('typesOfValue')
+            w.close('ResourceFrame')
+            w.close('frames')
+            w.close('CompositeFrame')
+
+        w.close('dataObjects')
+        f.write('</PublicationDelivery>\n')
+
+
+def generate_corpus(directory, files=10, operators=3, **kwargs):
+    # files are spread over one sub directory per operator, like a national fares drop
+    paths = []
+    for n in range(files):
+        operator = f"GEN{n % operators}"
+        operator_dir = os.path.join(directory, operator)
+        os.makedirs(operator_dir, exist_ok=True)
+        file_path = os.path.join(operator_dir, f"{operator}_line{n}.xml")
+        generate_fare_file(file_path, operator=operator, line=str(n), seed=n, **kwargs)
+        paths.append(file_path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic NeTEx fare files for benchmarking.")
+    parser.add_argument('output', help="Output .xml file, or a directory when --files is given")
+    parser.add_argument('--files', type=int, help="Write a corpus of this many files into the output directory")
+    parser.add_argument('--operators', type=int, default=3, help="Number of operators the corpus files are spread over")
+    parser.add_argument('--zones', type=int, default=20, help="Number of fare stages, the triangle has zones*(zones+1)/2 cells")
+    parser.add_argument('--stops_per_zone', type=int, default=3, help="ScheduledStopPoints per fare stage")
+    parser.add_argument('--products', type=int, default=1, help="Number of fare products")
+    parser.add_argument('--user_types', type=int, default=1, help="Number of user types")
+    parser.add_argument('--price_groups', type=int, default=4, help="Number of price groups")
+    parser.add_argument('--frames', type=int, default=1, help="Number of shared UK common resource frames")
+    args = parser.parse_args()
+
+    options = dict(zones=args.zones, stops_per_zone=args.stops_per_zone, products=args.products, user_types=args.user_types, price_groups=args.price_groups, frames=args.frames)
+    if args.files:
+        paths = generate_corpus(args.output, files=args.files, operators=args.operators, **options)
+        print(f"Wrote {len(paths)} files to {args.output}")
+    else:
+        generate_fare_file(args.output, **options)
+        print(f"Wrote {args.output}")
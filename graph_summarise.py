@@ -1,60 +1,48 @@
-import xml.etree.ElementTree as ET
 import argparse
+import hashlib
+import json
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
+from netex_extract import compile_spec, extract
+import netex_profile
+from netex_profile import count, phase
+
+FARES_SPEC = {
+    'Tariff': {
+        'into': 'tariffs',
+        'fields': {
+            'tariff_id': (None, 'id'),
+            'tariff_name': ('Name', 'text'),
+            'fare_type': ('TypeOfTariffRef', 'ref'),
+        },
+    },
+    'FareStructureElement': {
+        'into': 'fare_structure_elements',
+        'fields': {
+            'element_id': (None, 'id'),
+            'element_name': ('Name', 'text'),
+            'fare_structure_type': ('TypeOfFareStructureElementRef', 'ref'),
+        },
+    },
+    # distance matrix elements within each fare structure element
+    'DistanceMatrixElement': {
+        'into': 'distance_matrix_elements',
+        'parent': 'FareStructureElement',
+        'fields': {
+            'start_zone': ('StartTariffZoneRef', 'ref'),
+            'end_zone': ('EndTariffZoneRef', 'ref'),
+            'price_groups': ('PriceGroupRef', 'ref', 'all'),
+        },
+    },
+}
+
+FARES_EXTRACTION = compile_spec(FARES_SPEC)
 
 def parse_netex_fares(file_path):
-    # Parse the XML file
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    # Define the Netex namespace
-    ns = {'netex': 'http://www.netex.org.uk/netex'}
-
-    # Initialize data structures to hold information
-    tariffs = []
-    fare_structure_elements = []
-
-    # Extracting tariffs and their types
-    for tariff in root.findall('.//netex:Tariff', ns):
-        tariff_id = tariff.get('id')
-        tariff_name = tariff.find('.//netex:Name', ns).text if tariff.find('.//netex:Name', ns) is not None else None
-        fare_type = tariff.find('.//netex:TypeOfTariffRef', ns).get('ref') if tariff.find('.//netex:TypeOfTariffRef', ns) is not None else None
-
-        tariffs.append({
-            'tariff_id': tariff_id,
-            'tariff_name': tariff_name,
-            'fare_type': fare_type
-        })
-
-    # Extracting fare structure elements
-    for fare_element in root.findall('.//netex:FareStructureElement', ns):
-        element_id = fare_element.get('id')
-        element_name = fare_element.find('.//netex:Name', ns).text if fare_element.find('.//netex:Name', ns) is not None else None
-        fare_structure_type = fare_element.find('.//netex:TypeOfFareStructureElementRef', ns).get('ref') if fare_element.find('.//netex:TypeOfFareStructureElementRef', ns) is not None else None
-
-        # Extracting distance matrix elements within each fare structure element
-        distance_matrix_elements = []
-        for distance_matrix in fare_element.findall('.//netex:DistanceMatrixElement', ns):
-            start_zone = distance_matrix.find('.//netex:StartTariffZoneRef', ns).get('ref') if distance_matrix.find('.//netex:StartTariffZoneRef', ns) is not None else None
-            end_zone = distance_matrix.find('.//netex:EndTariffZoneRef', ns).get('ref') if distance_matrix.find('.//netex:EndTariffZoneRef', ns) is not None else None
-
-            # Extracting price group references if available
-            price_groups = [pg.get('ref') for pg in distance_matrix.findall('.//netex:PriceGroupRef', ns)]
-            distance_matrix_elements.append({
-                'start_zone': start_zone,
-                'end_zone': end_zone,
-                'price_groups': price_groups
-            })
-
-        fare_structure_elements.append({
-            'element_id': element_id,
-            'element_name': element_name,
-            'fare_structure_type': fare_structure_type,
-            'distance_matrix_elements': distance_matrix_elements
-        })
-
-    return tariffs, fare_structure_elements
+    # One pass over the file fills tariffs, fare structure elements and their distance matrix elements
+    data = extract(file_path, FARES_EXTRACTION)
+    return data['tariffs'], data['fare_structure_elements']
 
 def create_graph(tariffs, fare_structure_elements):
     # Initialize a directed graph
@@ -76,47 +64,146 @@ def create_graph(tariffs, fare_structure_elements):
             end_zone = matrix['end_zone']
             if start_zone and end_zone:
                 # Add zones as nodes
+                # zones remember the first fare structure element using them, for the hierarchical layout
                 if start_zone not in G:
-                    G.add_node(start_zone, label=f"Zone: {start_zone}", color='orange', type='zone')
+                    G.add_node(start_zone, label=f"Zone: {start_zone}", color='orange', type='zone', fare_structure=element['element_id'])
                 if end_zone not in G:
-                    G.add_node(end_zone, label=f"Zone: {end_zone}", color='orange', type='zone')
+                    G.add_node(end_zone, label=f"Zone: {end_zone}", color='orange', type='zone', fare_structure=element['element_id'])
 
                 # Connect start zone to end zone
                 G.add_edge(start_zone, end_zone, label=f"Price Groups: {', '.join(matrix['price_groups'])}")
 
     return G
 
-def visualize_graph(G):
+def hierarchical_layout(G):
+    """
+    Tariffs on the top row, fare structure elements below and their zones in a band underneath,
+    each element's zones split into start and end rows. Linear in the number of nodes, so it stays
+    usable for triangles with thousands of zones where spring_layout does not.
+    """
+    pos = {}
+    tariffs = [node for node in G if G.nodes[node].get('type') == 'tariff']
+    elements = [node for node in G if G.nodes[node].get('type') == 'fare_structure']
+    zones = {}
+    for node in G:
+        if G.nodes[node].get('type') == 'zone':
+            # zones with no outgoing edge only appear as end zones
+            row = 0 if G.out_degree(node) else 1
+            zones.setdefault((G.nodes[node].get('fare_structure'), row), []).append(node)
+
+    def spread(nodes, y, left=0.0, width=1.0):
+        for i, node in enumerate(nodes):
+            pos[node] = (left + width * (i + 0.5) / len(nodes), y)
+
+    spread(tariffs, 1.0)
+    spread(elements, 0.8)
+    # each fare structure element gets a slice of the width in proportion to its zones
+    owners = [element for element in elements if (element, 0) in zones or (element, 1) in zones]
+    owners += sorted({owner for owner, _ in zones if owner not in owners}, key=str)
+    sizes = [max(len(zones.get((owner, 0), [])), len(zones.get((owner, 1), []))) for owner in owners]
+    left = 0.0
+    for owner, size in zip(owners, sizes):
+        width = size / sum(sizes)
+        spread(zones.get((owner, 0), []), 0.5, left, width)
+        spread(zones.get((owner, 1), []), 0.2, left, width)
+        left += width
+    # anything else, so every node has a position
+    spread([node for node in G if node not in pos], 0.0)
+    return pos
+
+
+LAYOUTS = {
+    'spring': lambda G: nx.spring_layout(G, seed=42),  # Positioning for readability
+    'hierarchical': hierarchical_layout,
+}
+
+
+def graph_fingerprint(G, layout):
+    # positions are only reused for the same nodes, edges and layout
+    sha1 = hashlib.sha1(layout.encode('utf-8'))
+    for node in sorted(map(str, G.nodes)):
+        sha1.update(node.encode('utf-8') + b'\0')
+    for start, end in sorted((str(start), str(end)) for start, end in G.edges):
+        sha1.update(start.encode('utf-8') + b'\1' + end.encode('utf-8') + b'\0')
+    return sha1.hexdigest()
+
+
+def layout_graph(G, layout='spring', positions_path=None):
+    """
+    Node positions from the named layout. With positions_path the result is cached in that json file
+    and reused as long as the graph and layout are unchanged.
+    """
+    fingerprint = graph_fingerprint(G, layout) if positions_path else None
+    if positions_path and os.path.exists(positions_path):
+        with open(positions_path) as f:
+            cached = json.load(f)
+        if cached.get('fingerprint') == fingerprint:
+            count('cached_positions', 1)
+            by_name = {str(node): node for node in G}
+            return {by_name[name]: tuple(xy) for name, xy in cached['positions'].items()}
+
+    with phase('layout'):
+        pos = LAYOUTS[layout](G)
+    if positions_path:
+        with open(positions_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'layout': layout,
+                       'positions': {str(node): [float(x), float(y)] for node, (x, y) in pos.items()}}, f)
+    return pos
+
+
+def visualize_graph(G, layout='spring', positions_path=None, output=None, labels='all', arrows=True):
     # Get node colors and labels
     colors = [G.nodes[node].get('color', 'gray') for node in G]
-    labels = nx.get_node_attributes(G, 'label')
+    node_labels = nx.get_node_attributes(G, 'label') if labels != 'none' else {}
 
-    # Draw the graph
+    if output:
+        # headless, nothing is shown so no display is needed
+        plt.switch_backend('Agg')
+
+    # Draw the graph, nodes shrink once there are too many to fit at full size
     plt.figure(figsize=(15, 10))
-    pos = nx.spring_layout(G, seed=42)  # Positioning for readability
-    nx.draw(G, pos, node_color=colors, with_labels=True, labels=labels, node_size=2000, font_size=8, font_weight='bold', edge_color='gray', arrows=True)
+    node_size = min(2000, 200000 // max(len(G), 1))
+    pos = layout_graph(G, layout, positions_path)
+    with phase('draw'):
+        nx.draw(G, pos, node_color=colors, with_labels=labels != 'none', labels=node_labels, node_size=node_size, font_size=8, font_weight='bold', edge_color='gray', arrows=arrows)
     
-    # Draw edge labels
-    edge_labels = nx.get_edge_attributes(G, 'label')
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, label_pos=0.5)
+        # Draw edge labels
+        if labels == 'all':
+            edge_labels = nx.get_edge_attributes(G, 'label')
+            nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, label_pos=0.5)
 # %%
     plt.title("Netex Fares Model Visualization")
-    plt.show()
+    if output:
+        # png, svg or pdf from the file extension
+        with phase('save'):
+            plt.savefig(output, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
 
 if __name__ == "__main__":
     # Set up argument parser
-    # parser = argparse.ArgumentParser(description="Parse a Netex fares XML file and visualize fare model relationships.")
-    # parser.add_argument('file_path', help="Path to the Netex fares XML file")
+    parser = argparse.ArgumentParser(description="Parse a Netex fares XML file and visualize fare model relationships.")
+    parser.add_argument('file_path', nargs='?', default="../xml/line8415.xml", help="Path to the Netex fares XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='spring', help="spring (default) or hierarchical, which is linear in the number of nodes and suits large fare triangles")
+    parser.add_argument('--positions', help="Cache the computed node positions in this json file and reuse them while the graph is unchanged")
+    parser.add_argument('-o', '--output', help="Write the drawing to this png/svg/pdf file instead of showing it, no display needed")
+    parser.add_argument('--labels', choices=['all', 'nodes', 'none'], default='all', help="Which labels to draw, edge labels are the slowest part of large drawings (default all)")
+    parser.add_argument('--no_arrows', action='store_true', help="Draw edges as plain lines, one collection instead of a patch per edge, much faster for large graphs")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
 
     # Parse command-line arguments
-    # args = parser.parse_args()
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
     
     # Parse the Netex fares file
-    tariffs, fare_structure_elements = parse_netex_fares("../xml/line8415.xml")
-    # tariffs, fare_structure_elements = parse_netex_fares(args.file_path)
+    tariffs, fare_structure_elements = parse_netex_fares(args.file_path)
     # Create graph
-    G = create_graph(tariffs, fare_structure_elements)
+    with phase('build_graph'):
+        G = create_graph(tariffs, fare_structure_elements)
+    count('graph_nodes', G.number_of_nodes())
+    count('graph_edges', G.number_of_edges())
 
     # Visualize the graph
-    visualize_graph(G)
-
+    visualize_graph(G, args.layout, args.positions, args.output, args.labels, not args.no_arrows)
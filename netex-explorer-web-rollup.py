@@ -1,28 +1,17 @@
 from graphviz import Digraph
-import xml.etree.ElementTree as ET
-
-class NeTExElement:
-    def __init__(self, element):
-        self.tag = element.tag
-        self.attrib = element.attrib
-        self.text = element.text.strip() if element.text else ""
-        self.children = [NeTExElement(child) for child in element]
-        self.references = self.extract_references()
-
-    def __repr__(self):
-        return f"{self.tag}: {self.attrib}"
-
-    def extract_references(self):
-        references = []
-        for key, value in self.attrib.items():
-            if 'ref' in key.lower():
-                references.append(value)
-        return references
+import argparse
+import contextlib
+import sys
+import netex_profile
+from netex_profile import count, phase
+from netex_document import load_document
+from dot_stream import StreamingDigraph
 
 def parse_netex(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    return NeTExElement(root)
+    with phase('parse'):
+        document = load_document(file_path)
+    count('elements', len(document))
+    return document.root
 
 def strip_namespace(tag):
     return tag.split('}', 1)[-1] if '}' in tag else tag
@@ -42,20 +31,40 @@ def find_element_by_tag(element, tag):
             return result
     return None
 
-def find_element_by_id(element, element_id):
-    if element.attrib.get('id') == element_id:
-        return element
-    for child in element.children:
-        result = find_element_by_id(child, element_id)
-        if result:
-            return result
-    return None
-
-def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start_tag=None, node_map=None, rollup_tags=None, trim_tags=False):
-    if graph is None:
-        graph = Digraph()
+def add_reference_edges(graph, node_map, pending_refs, ids):
+    # One lookup per reference against every node drawn anywhere in the tree, so refs into
+    # sibling frames get their edge too. Refs to ids that exist but were not drawn are skipped.
+    dangling = []
+    for node_id, tag, ref in pending_refs:
+        ref_node_id = node_map.get(ref)
+        if ref_node_id:
+            graph.edge(node_id, ref_node_id, style='dashed', color='blue')
+        elif ref not in ids:
+            dangling.append((tag, ref))
+
+    if dangling:
+        print(f"{len(dangling)} references do not resolve to an id in the document:")
+        for tag, ref in dangling:
+            print(f"  {tag} -> {ref}")
+    return dangling
+
+def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start_tag=None, node_map=None, rollup_tags=None, trim_tags=False, ids=None, pending_refs=None):
+    if node_map is None:
+        # top level call: draw the tree, then add every reference edge against the finished node map
+        # a graph passed in (a StreamingDigraph, say) is drawn into instead of a new Digraph
+        graph = Digraph() if graph is None else graph
         node_map = {}
         # rollup_tags = {'Name','Description'}  # Add more tags as needed
+        pending_refs = []
+        with phase('index'):
+            ids = element.ids()
+        with phase('visualize'):
+            visualize_tree(element, graph, parent, depth, max_depth, start_tag, node_map, rollup_tags, trim_tags, ids, pending_refs)
+        with phase('reference_edges'):
+            add_reference_edges(graph, node_map, pending_refs, ids)
+        count('dot_nodes', len(node_map))
+        count('references', len(pending_refs))
+        return graph
 
     if start_tag:
         element = find_element_by_tag(element, start_tag)
@@ -74,7 +83,7 @@ def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start
         if element.attrib.get('id') in ['fxc:UK:DFT:TypeOfFrame_UK_PI_METADATA_OFFER:FXCP:fxc',]:  # this is the UK common resources
             return graph
     
-    element_id = element.attrib.get('id', str(id(element)))
+    element_id = element.attrib.get('id', element)
     if element_id not in node_map:
         node_map[element_id] = f"node{len(node_map)}"
     
@@ -100,24 +109,40 @@ def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start
         graph.edge(parent, node_id, id=edge_id)
 
     for child in remaining_children:
-        visualize_tree(child, graph, node_id, depth + 1, max_depth, node_map=node_map, rollup_tags=rollup_tags, trim_tags=trim_tags)
+        visualize_tree(child, graph, node_id, depth + 1, max_depth, node_map=node_map, ids=ids, pending_refs=pending_refs, rollup_tags=rollup_tags, trim_tags=trim_tags)
 
-    # Add edges for references
+    # Reference edges are added once every node has been drawn
     for ref in element.references:
-        ref_element = find_element_by_id(element, ref)
-        if ref_element:
-            ref_node_id = node_map.get(ref_element.attrib.get('id', str(id(ref_element))), None)
-            if ref_node_id:
-                graph.edge(node_id, ref_node_id, style='dashed', color='blue')
+        pending_refs.append((node_id, clean_tag, ref))
 
     return graph
 
 if __name__ == "__main__":
-    netex_file = "./RBUS_X4_Outbound_BoostSingle.xml"
+    parser = argparse.ArgumentParser(description="Draw the structure of a NeTEx file with graphviz.")
+    parser.add_argument('netex_file', nargs='?', default="./RBUS_X4_Outbound_BoostSingle.xml", help="Netex XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('-o', '--output', default="./graph.dot", help="DOT file to write, - for stdout (default ./graph.dot)")
+    parser.add_argument('--stream', action='store_true', help="Write nodes and edges to the output as they are visited instead of building the whole graph in memory first")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    netex_file = args.netex_file
     netex_tree = parse_netex(netex_file)
-    graph = visualize_tree(netex_tree, start_tag="dataObjects", max_depth=15, rollup_tags={'Name','Description'}, trim_tags=True)
-    graph.attr(rankdir='LR')  # Set the orientation to Left to Right
-    dot_data = graph.source
-
-    with open("./graph.dot", "w") as f:
-        f.write(dot_data)
\ No newline at end of file
+    output = sys.stdout if args.output == '-' else open(args.output, "w")
+
+    if args.stream:
+        with StreamingDigraph(output) as graph:
+            # the per tag progress lines would end up in the DOT when it goes to stdout
+            with contextlib.redirect_stdout(sys.stderr) if output is sys.stdout else contextlib.nullcontext():
+                visualize_tree(netex_tree, graph, start_tag="dataObjects", max_depth=15, rollup_tags={'Name','Description'}, trim_tags=True)
+            graph.attr(rankdir='LR')  # Set the orientation to Left to Right
+    else:
+        graph = visualize_tree(netex_tree, start_tag="dataObjects", max_depth=15, rollup_tags={'Name','Description'}, trim_tags=True)
+        graph.attr(rankdir='LR')  # Set the orientation to Left to Right
+        with phase('dot'):
+            dot_data = graph.source
+        output.write(dot_data)
+
+    if output is not sys.stdout:
+        output.close()
\ No newline at end of file
@@ -1,19 +1,15 @@
-import lxml.etree as ET
-from graphviz import Digraph
-
-class NeTExElement:
-    def __init__(self, element):
-        self.tag = element.tag
-        self.attrib = element.attrib
-        self.children = [NeTExElement(child) for child in element]
-
-    def __repr__(self):
-        return f"{self.tag}: {self.attrib}"
+from graphviz import Digraph, render
+import argparse
+import netex_profile
+from netex_profile import count, phase
+from netex_document import load_document
+from dot_stream import StreamingDigraph
 
 def parse_netex(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    return NeTExElement(root)
+    with phase('parse'):
+        document = load_document(file_path)
+    count('elements', len(document))
+    return document.root
 
 def strip_namespace(tag):
     return tag.split('}', 1)[-1] if '}' in tag else tag
@@ -45,7 +41,7 @@ def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start
     if depth > max_depth or element.tag.endswith("Element") or element.tag in ["Cell", "scheduledStopPoint","DistanceMatrixElement","PriceGroup","PriceGroupElement","PriceGroupElementPrice","PriceGroupElementRef","PriceGroupRef","PriceGroupRefPrice","PriceGroupRefStructure","PriceGroupRefStructureElement","PriceGroupRefStructureElementPrice","PriceGroupRefStructureElementRef","PriceGroupRefStructureRef","PriceGroupRefStructureRefPrice","PriceGroupRefStructureRefStructure","PriceGroupRefStructureRefStructureElement","PriceGroupRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRef","PriceGroupRefStructureRefStructureRefPrice","PriceGroupRefStructureRefStructureRefStructure","PriceGroupRefStructureRefStructureRefStructureElement","PriceGroupRefStructureRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRefStructureRef","PriceGroupRefStructureRefStructureRefStructureRefPrice","PriceGroupRefStructureRefStructureRefStructureRefStructure","PriceGroupRefStructureRefStructureRefStructureRefStructureElement","PriceGroupRefStructureRefStructureRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructure","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElement","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRefPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRefStructure","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElement","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRefPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRefStructure","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElement","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementPrice","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureElementRef","PriceGroupRefStructureRefStructureRefStructureRefStructureRefStructureRef","fareTables" ,"GeographicalUnit"]:
         return graph
     
-    node_id = str(id(element))
+    node_id = str(element.index)
     clean_tag = strip_namespace(element.tag)
     formatted_attrib = format_attributes(element.attrib)
     graph.node(node_id, f"{clean_tag}\n{formatted_attrib}")
@@ -59,9 +55,28 @@ def visualize_tree(element, graph=None, parent=None, depth=0, max_depth=4, start
     return graph
 
 if __name__ == "__main__":
-    netex_file = "./RBUS_X4_Outbound_BoostSingle.xml"
+    parser = argparse.ArgumentParser(description="Draw the structure of a NeTEx file with graphviz.")
+    parser.add_argument('netex_file', nargs='?', default="./RBUS_X4_Outbound_BoostSingle.xml", help="Netex XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('--stream', action='store_true', help="Write nodes and edges to output_graph as they are visited instead of building the whole graph in memory first")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    netex_file = args.netex_file
     netex_tree = parse_netex(netex_file)
-    graph = visualize_tree(netex_tree, start_tag="dataObjects", max_depth=4)
-    # graph.render("netex_tree", format="png", view=True)
-    graph.attr(rankdir='LR')  # Set the orientation to Top to Bottom
-    graph.render("output_graph", format="png")
\ No newline at end of file
+    if args.stream:
+        # same output_graph source file as graph.render writes, then the same dot run over it
+        with open("output_graph", "w") as f, StreamingDigraph(f) as graph:
+            with phase('visualize'):
+                visualize_tree(netex_tree, graph, start_tag="dataObjects", max_depth=4)
+            graph.attr(rankdir='LR')  # Set the orientation to Top to Bottom
+        with phase('render'):
+            render('dot', 'png', "output_graph")
+    else:
+        with phase('visualize'):
+            graph = visualize_tree(netex_tree, start_tag="dataObjects", max_depth=4)
+        # graph.render("netex_tree", format="png", view=True)
+        graph.attr(rankdir='LR')  # Set the orientation to Top to Bottom
+        with phase('render'):
+            graph.render("output_graph", format="png")
\ No newline at end of file
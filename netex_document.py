@@ -0,0 +1,200 @@
+import xml.etree.ElementTree as ET
+from array import array
+from netex_sources import open_netex
+
+# A whole NeTEx document held as flat arrays instead of one Python object per element.
+#
+# Node i has
+#   tag_ids[i]                   index into tags, each distinct tag stored once
+#   parents[i], first_children[i], next_siblings[i]   node numbers, -1 for none
+#   attrib_starts[i]:attrib_starts[i+1]   slice of attrib_keys / attrib_values, indexes into strings
+#   text_ids[i]                  index into strings of the stripped text, -1 for none
+#
+# Repeated strings (attribute names, versions, refs, text) are stored once in the shared pool.
+# NeTExNode is a small read-only view over one node number with the same attributes the
+# explorers used on the old NeTExElement wrapper: tag, attrib, text, children, references.
+# The explorers' parse_netex return the root node of a loaded document in place of that tree,
+# which for a large fare file is several times smaller than one wrapper object per element.
+
+
+class NeTExDocument:
+    def __init__(self):
+        self.tags = []
+        self.strings = []
+        self.tag_ids = array('i')
+        self.parents = array('i')
+        self.first_children = array('i')
+        self.next_siblings = array('i')
+        self.attrib_starts = array('i')
+        self.attrib_keys = array('i')
+        self.attrib_values = array('i')
+        self.text_ids = array('i')
+
+    def __len__(self):
+        return len(self.tag_ids)
+
+    @property
+    def root(self):
+        return NeTExNode(self, 0)
+
+    def node(self, index):
+        return NeTExNode(self, index)
+
+
+def load_document(file_path):
+    with open_netex(file_path) as source:
+        return build_document(ET.iterparse(source, events=('start', 'end')), drop_elements=True)
+
+
+def document_from_root(root):
+    """
+    The same compact document built from a tree that is already parsed, ElementTree or lxml,
+    so a caller holding the tree does not read the file again.
+    """
+    return build_document(walk_events(root), drop_elements=False)
+
+
+def walk_events(root):
+    # the start / end events iterparse would give for a parsed tree, comments left out as iterparse does
+    stack = [(root, False)]
+    while stack:
+        elem, done = stack.pop()
+        if done:
+            yield 'end', elem
+        elif isinstance(elem.tag, str):
+            yield 'start', elem
+            stack.append((elem, True))
+            stack.extend((child, False) for child in reversed(elem))
+
+
+def build_document(events, drop_elements):
+    # drop_elements clears each element once copied, for events straight from iterparse
+    document = NeTExDocument()
+    tag_pool = {}
+    string_pool = {}
+    last_children = array('i')
+    stack = []  # (element, node number) for the elements we are inside
+
+    def intern(pool, values, value):
+        value_id = pool.get(value)
+        if value_id is None:
+            value_id = pool[value] = len(values)
+            values.append(value)
+        return value_id
+
+    for event, elem in events:
+        if event == 'start':
+            node = len(document.tag_ids)
+            parent = stack[-1][1] if stack else -1
+            document.tag_ids.append(intern(tag_pool, document.tags, elem.tag))
+            document.parents.append(parent)
+            document.first_children.append(-1)
+            document.next_siblings.append(-1)
+            document.text_ids.append(-1)
+            last_children.append(-1)
+            if parent != -1:
+                if last_children[parent] == -1:
+                    document.first_children[parent] = node
+                else:
+                    document.next_siblings[last_children[parent]] = node
+                last_children[parent] = node
+
+            document.attrib_starts.append(len(document.attrib_keys))
+            for key, value in elem.attrib.items():
+                document.attrib_keys.append(intern(string_pool, document.strings, key))
+                document.attrib_values.append(intern(string_pool, document.strings, value))
+
+            stack.append((elem, node))
+            continue
+
+        _, node = stack.pop()
+        if elem.text and elem.text.strip():
+            document.text_ids[node] = intern(string_pool, document.strings, elem.text.strip())
+
+        # the element has been copied into the arrays, drop it
+        if drop_elements:
+            if stack:
+                stack[-1][0].remove(elem)
+            elem.clear()
+
+    document.attrib_starts.append(len(document.attrib_keys))
+    return document
+
+
+class NeTExNode:
+    __slots__ = ('document', 'index')
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    def __repr__(self):
+        return f"{self.tag}: {self.attrib}"
+
+    def __eq__(self, other):
+        return isinstance(other, NeTExNode) and other.document is self.document and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.document), self.index))
+
+    @property
+    def tag(self):
+        return self.document.tags[self.document.tag_ids[self.index]]
+
+    @property
+    def attrib(self):
+        document = self.document
+        strings = document.strings
+        start, end = document.attrib_starts[self.index], document.attrib_starts[self.index + 1]
+        return {strings[document.attrib_keys[i]]: strings[document.attrib_values[i]] for i in range(start, end)}
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    @property
+    def text(self):
+        text_id = self.document.text_ids[self.index]
+        return self.document.strings[text_id] if text_id != -1 else ""
+
+    @property
+    def children(self):
+        document = self.document
+        children = []
+        child = document.first_children[self.index]
+        while child != -1:
+            children.append(NeTExNode(document, child))
+            child = document.next_siblings[child]
+        return children
+
+    @property
+    def references(self):
+        return [value for key, value in self.attrib.items() if 'ref' in key.lower()]
+
+    def getparent(self):
+        parent = self.document.parents[self.index]
+        return NeTExNode(self.document, parent) if parent != -1 else None
+
+    def subtree_end(self):
+        # nodes are numbered in document order, so a subtree runs up to the next sibling of
+        # the node or of its nearest ancestor that has one
+        document = self.document
+        index = self.index
+        while index != -1:
+            if document.next_siblings[index] != -1:
+                return document.next_siblings[index]
+            index = document.parents[index]
+        return len(document)
+
+    def iter(self):
+        for index in range(self.index, self.subtree_end()):
+            yield NeTExNode(self.document, index)
+
+    def ids(self):
+        # every id in the subtree, read off the attribute arrays without a node object per element
+        document = self.document
+        try:
+            id_key = document.strings.index('id')
+        except ValueError:
+            return set()
+        start, end = document.attrib_starts[self.index], document.attrib_starts[self.subtree_end()]
+        return {document.strings[document.attrib_values[i]] for i in range(start, end) if document.attrib_keys[i] == id_key}
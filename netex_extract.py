@@ -0,0 +1,115 @@
+import xml.etree.ElementTree as ET
+from netex_profile import count, enabled, phase
+from netex_sources import open_netex
+
+NETEX_NS = '{http://www.netex.org.uk/netex}'
+
+# An extraction spec maps an entity tag to the record built for each element with that tag.
+#
+#   'Tariff': {
+#       'into': 'tariffs',                    # list on the parent record the new record is appended to
+#       'parent': None,                       # entity tag of the parent record, None for the document
+#       'fields': {
+#           'tariff_id': (None, 'id'),                    # attribute of the entity element itself
+#           'tariff_name': ('Name', 'text'),              # text of the first descendant <Name>
+#           'tariff_type': ('TypeOfTariffRef', 'ref'),    # attribute of the first descendant
+#           'price_groups': ('PriceGroupRef', 'ref', 'all'),  # attribute of every descendant, as a list
+#       },
+#   }
+#
+# The spec entry None holds fields read from the document as a whole, which end up on the
+# returned dict next to the top level entity lists.
+#
+# compile_spec turns a spec into a dispatch table keyed on namespaced tag, so that extract can
+# fill every record in a single walk of the tree instead of one descendant search per field.
+
+
+def compile_spec(spec):
+    if None not in spec:
+        spec = {None: {'fields': {}}, **spec}
+    entities = {}
+    lookups = {}
+    for entity, entry in spec.items():
+        entity_tag = NETEX_NS + entity if entity is not None else None
+        parent = entry.get('parent')
+        entities[entity_tag] = {
+            'into': entry.get('into'),
+            'parent': NETEX_NS + parent if parent is not None else None,
+            'fields': entry['fields'],
+            'children': [spec[child]['into'] for child in spec if child is not None and spec[child].get('parent') == entity],
+        }
+        for key, field in entry['fields'].items():
+            tag, value = field[0], field[1]
+            many = len(field) > 2 and field[2] == 'all'
+            if tag is None:
+                continue
+            lookups.setdefault(NETEX_NS + tag, []).append((entity_tag, key, value, many))
+    return {'entities': entities, 'lookups': lookups}
+
+
+def new_record(entity, elem):
+    record = {}
+    for key, field in entity['fields'].items():
+        tag, value = field[0], field[1]
+        many = len(field) > 2 and field[2] == 'all'
+        if tag is None:
+            record[key] = elem.get(value) if elem is not None else None
+        else:
+            record[key] = [] if many else None
+    for into in entity['children']:
+        record[into] = []
+    return record
+
+
+def extract(file_path, compiled):
+    with phase('parse'):
+        with open_netex(file_path) as source:
+            root = ET.parse(source).getroot()
+    if enabled():
+        count('elements', sum(1 for _ in root.iter()))
+    return extract_root(root, compiled)
+
+
+def extract_root(root, compiled):
+    # the walk only uses tag, text, get and iteration, so an lxml root parsed elsewhere works too
+    entities = compiled['entities']
+    lookups = compiled['lookups']
+
+    document = new_record(entities[None], None)
+    # entity tag -> stack of (record, keys already found) for the entities we are inside
+    open_records = {tag: [] for tag in entities}
+    open_records[None].append((document, set()))
+
+    def visit(elem):
+        tag = elem.tag
+
+        # fields first, so an entity never matches its own fields
+        for entity_tag, key, value, many in lookups.get(tag, ()):
+            found_value = elem.text if value == 'text' else elem.get(value)
+            for record, found in open_records[entity_tag]:
+                if many:
+                    record[key].append(found_value)
+                elif key not in found:
+                    found.add(key)
+                    record[key] = found_value
+
+        entity = entities.get(tag)
+        if entity is not None:
+            record = new_record(entity, elem)
+            # a nested entity belongs to every enclosing parent, as a descendant search would find it
+            for parent_record, _ in open_records[entity['parent']]:
+                parent_record[entity['into']].append(record)
+            open_records[tag].append((record, set()))
+
+        for child in elem:
+            visit(child)
+
+        if entity is not None:
+            open_records[tag].pop()
+
+    # like './/' from the root, only descendants of the root are matched
+    with phase('extract'):
+        for child in root:
+            visit(child)
+
+    return document
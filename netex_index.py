@@ -0,0 +1,34 @@
+def build_index(root):
+    """
+    Walk the document once and return
+      ids:  id -> every element carrying that id, in document order (the same id on different
+            element types is normal NeTEx, a FareStructureElement and its GenericParameterAssignment say)
+      refs: ref -> every element whose ref attribute is that value, in document order
+    Works on lxml and ElementTree elements, and on anything else with iter() and attrib.
+    """
+    ids = {}
+    refs = {}
+    for element in root.iter():
+        attrib = element.attrib
+        element_id = attrib.get('id')
+        if element_id is not None:
+            ids.setdefault(element_id, []).append(element)
+        ref = attrib.get('ref')
+        if ref is not None:
+            refs.setdefault(ref, []).append(element)
+    return {'ids': ids, 'refs': refs}
+
+
+def find_by_id(index, element_id, tag=None):
+    # the first element with the id, of the given tag if there is one
+    for element in index['ids'].get(element_id, []):
+        if tag is None or element.tag == tag:
+            return element
+    return None
+
+
+def find_referring(index, ref, tag=None):
+    elements = index['refs'].get(ref, [])
+    if tag is None:
+        return elements
+    return [element for element in elements if element.tag == tag]
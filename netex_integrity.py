@@ -0,0 +1,152 @@
+import xml.etree.ElementTree as ET
+import argparse
+import csv
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import netex_profile
+from netex_profile import count, phase
+from netex_sources import find_netex_files, open_netex
+
+# Referential integrity of a NeTEx corpus: every ref must resolve to an id.
+#
+# Each file gets one streaming pass that puts its ids and refs into hash sets, so checking is
+# linear in the size of the corpus rather than one XPath search per ref. Refs that do not resolve
+# inside their own file are then looked up in the ids of the whole corpus, which is how refs to
+# shared resources (the fxc: frames and types, operators, stops) defined in other files resolve.
+#
+# Reported per file
+#   dangling   a ref that no file in the corpus defines
+#   duplicate  an element type, id and version that occurs more than once in the file
+# The same id on different element types (a FareStructureElement and its GenericParameterAssignment)
+# is normal NeTEx and not a duplicate, nor is the same id in several files.
+
+NETEX_NS = '{http://www.netex.org.uk/netex}'
+
+# versionRef holds a version, not an id
+NOT_REFERENCES = {'versionRef'}
+
+
+def local_name(tag):
+    return tag[len(NETEX_NS):] if tag.startswith(NETEX_NS) else tag
+
+
+def scan_file(file_path):
+    """
+    One streaming pass over a file. Returns a dict of
+      ids         the set of ids defined in the file
+      duplicates  (tag, id, version) -> count for ids defined more than once
+      unresolved  ref -> [referring tag, count] for refs not defined in the file itself
+      refs        number of refs in the file
+    A ref is the ref attribute of a ...Ref element, or an attribute named ...Ref such as dataSourceRef.
+    """
+    ids = set()
+    seen = set()
+    duplicates = {}
+    references = {}
+    ref_count = 0
+
+    with open_netex(file_path) as source:
+        for _, elem in ET.iterparse(source, events=('end',)):
+            attrib = elem.attrib
+            if attrib:
+                element_id = attrib.get('id')
+                if element_id is not None:
+                    ids.add(element_id)
+                    key = (local_name(elem.tag), element_id, attrib.get('version'))
+                    if key in seen:
+                        duplicates[key] = duplicates.get(key, 1) + 1
+                    else:
+                        seen.add(key)
+                for name, value in attrib.items():
+                    if name == 'ref' or (name.endswith('Ref') and name not in NOT_REFERENCES):
+                        ref_count += 1
+                        referring = references.get(value)
+                        if referring is None:
+                            references[value] = [local_name(elem.tag) if name == 'ref' else f"{local_name(elem.tag)}@{name}", 1]
+                        else:
+                            referring[1] += 1
+            # drop what has been read, only the open elements and empty shells stay in memory
+            elem.clear()
+
+    unresolved = {ref: referring for ref, referring in references.items() if ref not in ids}
+    return {'ids': ids, 'duplicates': duplicates, 'unresolved': unresolved, 'refs': ref_count}
+
+
+def check_file(file_path):
+    # scan_file for the worker processes, a file that cannot be read is reported rather than stopping the run
+    try:
+        return file_path, scan_file(file_path), None
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, ET.ParseError) as e:
+        return file_path, None, f"{type(e).__name__}: {e}"
+
+
+def check_corpus(file_paths, workers=1):
+    """
+    Check every file and resolve refs across the corpus.
+    Returns (problems, totals) where problems is a list of (file, problem, tag, value, count) rows.
+    """
+    corpus_ids = set()
+    pending = []  # (file, unresolved) until every file's ids are known
+    problems = []
+    totals = {'files': 0, 'unreadable': 0, 'ids': 0, 'refs': 0, 'resolved_in_file': 0, 'resolved_in_corpus': 0, 'dangling': 0, 'duplicates': 0}
+
+    with phase('scan'), ExitStack() as pool:
+        if workers > 1:
+            executor = pool.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = executor.map(check_file, file_paths, chunksize=max(1, len(file_paths) // (workers * 8)))
+        else:
+            results = map(check_file, file_paths)
+        for file_path, result, error in results:
+            totals['files'] += 1
+            if result is None:
+                totals['unreadable'] += 1
+                problems.append((file_path, 'unreadable', '', error, 1))
+                continue
+            corpus_ids |= result['ids']
+            totals['ids'] += len(result['ids'])
+            totals['refs'] += result['refs']
+            totals['resolved_in_file'] += result['refs'] - sum(n for _, n in result['unresolved'].values())
+            for (tag, element_id, version), n in result['duplicates'].items():
+                totals['duplicates'] += 1
+                problems.append((file_path, 'duplicate', tag, f"{element_id} version {version}" if version else element_id, n))
+            if result['unresolved']:
+                pending.append((file_path, result['unresolved']))
+    count('files', totals['files'])
+    count('refs', totals['refs'])
+
+    with phase('resolve'):
+        for file_path, unresolved in pending:
+            for ref, (tag, n) in unresolved.items():
+                if ref in corpus_ids:
+                    totals['resolved_in_corpus'] += n
+                else:
+                    totals['dangling'] += n
+                    problems.append((file_path, 'dangling', tag, ref, n))
+    return problems, totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every ref in a NeTEx corpus resolves to an id, and that no file defines an id twice.")
+    parser.add_argument('paths', nargs='+', help="Netex files, directories or .zip archives; refs resolve across all of them")
+    parser.add_argument('-o', '--output', default='integrity.csv', help="Csv file to write the problems to (default integrity.csv)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes to scan files with (default 1)")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    file_paths = [os.path.join(root, filename) for path in args.paths for root, filename in find_netex_files(path)]
+    problems, totals = check_corpus(file_paths, args.workers)
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'problem', 'tag', 'value', 'count'])
+        writer.writerows(problems)
+
+    print(f"{totals['files']} files, {totals['ids']} ids, {totals['refs']} refs")
+    print(f"  {totals['resolved_in_file']} resolved in their own file, {totals['resolved_in_corpus']} in another file, {totals['dangling']} dangling")
+    print(f"  {totals['duplicates']} duplicate ids, {totals['unreadable']} unreadable files")
+    print(f"Problems written to {args.output}")
@@ -0,0 +1,99 @@
+import atexit
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is then left out of the report
+    resource = None
+
+# Shared --profile support for the command line scripts.
+#
+# Library code wraps its stages in `with phase('parse'):` and reports sizes with count(); both
+# do nothing until a script calls enable(), so the instrumentation costs nothing otherwise.
+# Phases may nest (extract inside summarise, say), each is timed on its own.
+# The json report is written when the process exits, which also covers the tracer's quit() calls.
+#
+# Memory is reported as peak RSS. tracemalloc gives the peak of Python allocations instead but
+# slows allocation heavy code (parsing, indexing) by half again or more, which would skew the
+# timings in the same report, so it only runs when NETEX_PROFILE_TRACEMALLOC=1 is set. The report
+# says whether it was on; compare timings only between reports where it was off.
+
+_enabled = False
+_started = None
+_phases = {}
+_counts = {}
+_files = []
+
+
+def enable(report_path):
+    global _enabled, _started
+    _enabled = True
+    if os.environ.get('NETEX_PROFILE_TRACEMALLOC') == '1':
+        tracemalloc.start()
+    _started = (time.perf_counter(), time.process_time())
+    atexit.register(write_report, report_path)
+
+
+def enabled():
+    return _enabled
+
+
+@contextmanager
+def phase(name):
+    if not _enabled:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        entry = _phases.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        entry['calls'] += 1
+        entry['wall_seconds'] += time.perf_counter() - wall
+        entry['cpu_seconds'] += time.process_time() - cpu
+
+
+def count(name, value):
+    if _enabled:
+        _counts[name] = _counts.get(name, 0) + value
+
+
+def record_file(file_path, seconds):
+    # per file timings for batch runs
+    if _enabled:
+        _files.append({'file': file_path, 'seconds': seconds})
+
+
+def report():
+    result = {
+        'script': os.path.basename(sys.argv[0]),
+        'wall_seconds': time.perf_counter() - _started[0],
+        'cpu_seconds': time.process_time() - _started[1],
+        'phases': _phases,
+        'counts': _counts,
+        # timings above are inflated when this is on
+        'tracemalloc': tracemalloc.is_tracing(),
+        'tracemalloc_peak_bytes': tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+    }
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if children.ru_utime or children.ru_stime:
+            result['children_cpu_seconds'] = children.ru_utime + children.ru_stime
+            result['children_peak_rss_bytes'] = children.ru_maxrss * scale
+    if _files:
+        result['files'] = _files
+    return result
+
+
+def write_report(report_path):
+    with open(report_path, 'w') as f:
+        json.dump(report(), f, indent=2)
+    print(f"Profile written to {report_path}", file=sys.stderr)
@@ -0,0 +1,64 @@
+from lxml import etree
+
+# The tracer lookups as XPath expressions compiled once, with the ids passed as $variables.
+#
+# Building the expression with an f-string makes lxml compile it again on every call, and an id
+# containing a quote breaks the query. Here each expression is compiled when the module is
+# imported and the id is bound as a parameter, so any id is safe:
+#
+#   fare_zones_for_stop(tree, "atco:0100'BRA")
+#
+# For many lookups against the same document the id/ref index in netex_index is cheaper still;
+# these suit one-off questions where building the index would cost more than it saves.
+
+NS = {'netex': 'http://www.netex.org.uk/netex'}
+
+# the FareZone two levels above each reference to the stop, as tracer5 navigates it
+FARE_ZONES_FOR_STOP = etree.XPath("//netex:ScheduledStopPointRef[@ref = $stop_id]/../parent::netex:FareZone", namespaces=NS)
+DISTANCE_MATRIX_ELEMENTS_FROM_ZONE = etree.XPath(
+    "//netex:DistanceMatrixElement[netex:StartTariffZoneRef/@ref = $start_zone_id]", namespaces=NS)
+DISTANCE_MATRIX_ELEMENTS_BETWEEN_ZONES = etree.XPath(
+    "//netex:DistanceMatrixElement[netex:StartTariffZoneRef/@ref = $start_zone_id and netex:EndTariffZoneRef/@ref = $end_zone_id]", namespaces=NS)
+PRICE_GROUP_REFS = etree.XPath(".//netex:PriceGroupRef/@ref", namespaces=NS)
+PRICE_GROUP_BY_ID = etree.XPath("//netex:PriceGroup[@id = $price_group_id]", namespaces=NS)
+AMOUNTS = etree.XPath(".//netex:Amount", namespaces=NS)
+CONTAINING_FARE_STRUCTURE_ELEMENT = etree.XPath("ancestor::netex:FareStructureElement[1]", namespaces=NS)
+REFERENCES_BELOW = etree.XPath(".//netex:*[@ref = $ref]", namespaces=NS)
+
+
+def first(results):
+    return results[0] if results else None
+
+
+def fare_zones_for_stop(tree, stop_id):
+    return FARE_ZONES_FOR_STOP(tree, stop_id=stop_id)
+
+
+def distance_matrix_elements(tree, start_zone_id, end_zone_id=None):
+    # in document order, so the first one is the one the tracer picks
+    if end_zone_id is None:
+        return DISTANCE_MATRIX_ELEMENTS_FROM_ZONE(tree, start_zone_id=start_zone_id)
+    return DISTANCE_MATRIX_ELEMENTS_BETWEEN_ZONES(tree, start_zone_id=start_zone_id, end_zone_id=end_zone_id)
+
+
+def price_group_for_distance_matrix(tree, element):
+    ref = first(PRICE_GROUP_REFS(element))
+    return first(PRICE_GROUP_BY_ID(tree, price_group_id=ref)) if ref is not None else None
+
+
+def amount_for_price_group(price_group):
+    # (amount text, tag and id of the element holding the amount), as tracer5.find_amount_for_price_group
+    amount = first(AMOUNTS(price_group))
+    if amount is None:
+        return None
+    return amount.text, amount.getparent().tag, amount.getparent().get('id')
+
+
+def containing_fare_structure_element(element):
+    # the nearest FareStructureElement above element, None for an element outside every one
+    return first(CONTAINING_FARE_STRUCTURE_ELEMENT(element))
+
+
+def references_below(element, ref):
+    # every element under element (or the whole tree) with ref="..."
+    return REFERENCES_BELOW(element, ref=ref)
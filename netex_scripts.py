@@ -0,0 +1,16 @@
+import importlib.util
+import os
+from functools import lru_cache
+
+# The explorer scripts (netex-explorer-web.py and friends) have hyphenated file names, so they
+# cannot be imported the usual way; pipeline and benchmark load them through load_script.
+
+
+@lru_cache(maxsize=None)
+def load_script(file_name):
+    # one module per script and process, loaded from next to this file
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+    spec = importlib.util.spec_from_file_location(file_name.replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,148 @@
+import bz2
+import gzip
+import os
+import zipfile
+from contextlib import contextmanager
+from functools import lru_cache
+
+# NeTEx inputs as plain .xml files, single .xml.gz / .xml.bz2 files, or members of .zip archives.
+#
+# A member is named by its path inside the archive appended to the archive path, as if the
+# archive were a directory:  bundle.zip/RBUS/line8415.xml
+#
+# open_netex gives a binary stream for any of these that the parsers (ElementTree, iterparse,
+# lxml) read directly, so nothing is ever extracted to disk. Workers that each open their own
+# members decode the members of one archive in parallel.
+
+COMPRESSED = {'.gz': gzip.open, '.bz2': bz2.open}
+NETEX_SUFFIXES = ('.xml', '.xml.gz', '.xml.bz2')
+
+
+def is_netex_file(filename):
+    return filename.lower().endswith(NETEX_SUFFIXES)
+
+
+def source_name(path):
+    # file name without .xml / .xml.gz / .xml.bz2 / .zip, for naming outputs after their source
+    name = os.path.basename(path)
+    for suffix in NETEX_SUFFIXES + ('.zip',):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def relative_source_name(path, root):
+    # source_name keeping the directories between root and path, so outputs from a whole tree do not
+    # collide: root/a/b/c.xml -> 'a__b__c', and inside root.zip, root.zip/a/c.xml -> 'a__c'
+    directory = os.path.relpath(os.path.dirname(path) or os.curdir, root or os.curdir)
+    parts = [] if directory == os.curdir else directory.replace(os.sep, '/').split('/')
+    return '__'.join(parts + [source_name(path)])
+
+
+def split_archive_path(path):
+    # 'a/bundle.zip/b/c.xml' -> ('a/bundle.zip', 'b/c.xml'), (path, None) when path is not inside an archive
+    if os.path.exists(path):
+        return path, None
+    normalised = path.replace(os.sep, '/')
+    position = normalised.lower().find('.zip/')
+    while position != -1:
+        archive = path[:position + 4]
+        if os.path.isfile(archive):
+            return archive, normalised[position + 5:]
+        position = normalised.lower().find('.zip/', position + 1)
+    return path, None
+
+
+@lru_cache(maxsize=8)
+def open_archive(archive, size, mtime_ns, pid):
+    # one ZipFile per archive and process, so the central directory is read once rather than per member.
+    # size and mtime are in the key so a replaced archive is opened afresh, the pid so a forked
+    # worker never shares its parent's file position
+    return zipfile.ZipFile(archive)
+
+
+def archive_for(archive):
+    stat = os.stat(archive)
+    return open_archive(os.path.abspath(archive), stat.st_size, stat.st_mtime_ns, os.getpid())
+
+
+def archive_members(archive):
+    # NeTEx members in archive order
+    return [info.filename for info in archive_for(archive).infolist() if not info.is_dir() and is_netex_file(info.filename)]
+
+
+@contextmanager
+def open_netex(path):
+    """
+    Binary stream of the XML in path, decompressing .gz / .bz2 and reading zip members in place.
+    A .zip given on its own must hold exactly one NeTEx file.
+    """
+    archive, member = split_archive_path(path)
+    if member is None and path.lower().endswith('.zip'):
+        members = archive_members(path)
+        if len(members) != 1:
+            raise ValueError(f"{path} holds {len(members)} NeTEx files, name one as {path}/<member>")
+        archive, member = path, members[0]
+
+    if member is not None:
+        with archive_for(archive).open(member) as raw:
+            opener = COMPRESSED.get(os.path.splitext(member)[1].lower())
+            if opener is None:
+                yield raw
+            else:
+                with opener(raw) as source:
+                    yield source
+        return
+
+    opener = COMPRESSED.get(os.path.splitext(path)[1].lower(), open)
+    with opener(path, 'rb') as source:
+        yield source
+
+
+def source_stat(path):
+    """
+    (size, mtime_ns) fingerprint of a source. Members use their own size and the archive's mtime.
+    """
+    archive, member = split_archive_path(path)
+    stat = os.stat(archive)
+    if member is None:
+        return stat.st_size, stat.st_mtime_ns
+    return archive_for(archive).getinfo(member).file_size, stat.st_mtime_ns
+
+
+def source_exists(path):
+    # a file, or a member of an archive that is still there
+    try:
+        source_stat(path)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+    return True
+
+
+def find_netex_files(path):
+    """
+    (directory, filename) for every NeTEx source under path, a directory or a .zip, in walk order.
+    Archive members are expanded in place: bundle.zip/b/c.xml comes back as ('.../bundle.zip/b', 'c.xml').
+    An archive that cannot be read comes back whole, for the caller to report when opening it fails.
+    """
+    def expand(root, filename):
+        if filename.lower().endswith('.zip'):
+            archive = os.path.join(root, filename)
+            try:
+                members = archive_members(archive)
+            except zipfile.BadZipFile:
+                # a corrupt archive comes back as itself, so opening it fails for that one file
+                yield root, filename
+                return
+            for member in members:
+                directory, name = os.path.split(os.path.join(archive, member))
+                yield directory, name
+        elif is_netex_file(filename):
+            yield root, filename
+
+    if not os.path.isdir(path):
+        yield from expand(*os.path.split(path))
+        return
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            yield from expand(root, filename)
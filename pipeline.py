@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import networkx as nx
+from lxml import etree
+
+import netex_profile
+from netex_profile import count, phase
+from netex_document import document_from_root
+from netex_extract import extract_root
+from netex_index import build_index
+from dot_stream import StreamingDigraph
+from netex_sources import find_netex_files, open_netex, relative_source_name
+from netex_scripts import load_script
+import graph_summarise
+import simple_summary
+import summarise4
+import tracer5
+
+# One parse per file, any selection of reports over it.
+#
+# Each file is parsed once with lxml and indexed once; the stages below all read that shared
+# model instead of running their own parse_netex_fares / parse_netex. Over a directory, files
+# go through the stages one at a time (or spread over --workers processes) and their results are
+# written as they come back, so only the files in flight are ever held in memory.
+#
+#   summary   the simple_summary row, collected into summary.csv
+#   fares     the summarise4 fare structure, collected into fares.jsonl
+#   graph     the graph_summarise tariff / zone graph, <file>.graphml
+#   prices    the tracer5 all pairs stop x stop price matrix, <file>_prices.csv
+#   dot       the netex-explorer-web structure drawing, <file>.dot, streamed as it is drawn
+#
+# <file> is the file's path below the directory or archive it was found in, with the directories
+# joined by '__', so files of the same name in different directories do not overwrite each other.
+# A stage that fails on a file is reported and the other stages still run.
+
+
+def summary_stage(model, output_dir):
+    return simple_summary.summary_row(simple_summary.summarise_root(model['root']), *os.path.split(model['file_path']))
+
+
+def fares_stage(model, output_dir):
+    return dict(extract_root(model['root'], summarise4.FARES_EXTRACTION), file=model['file_path'])
+
+
+def graph_stage(model, output_dir):
+    data = extract_root(model['root'], graph_summarise.FARES_EXTRACTION)
+    G = graph_summarise.create_graph(data['tariffs'], data['fare_structure_elements'])
+    nx.write_graphml(G, os.path.join(output_dir, model['name'] + '.graphml'))
+    count('graph_nodes', G.number_of_nodes())
+
+
+def prices_stage(model, output_dir):
+    prices, stop_ids, _ = tracer5.all_pairs_price_matrix(model['tree'], model['index'])
+    tracer5.write_price_matrix_csv(os.path.join(output_dir, model['name'] + '_prices.csv'), prices, stop_ids)
+    count('stops', len(stop_ids))
+
+
+def dot_stage(model, output_dir):
+    explorer = load_script('netex-explorer-web.py')
+    # the explorer draws from the compact document, built here from the tree already parsed
+    root = document_from_root(model['root']).root
+    with open(os.path.join(output_dir, model['name'] + '.dot'), 'w') as f, StreamingDigraph(f) as graph:
+        # visualize_tree prints every tag it visits
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            explorer.visualize_tree(root, graph, start_tag="dataObjects", max_depth=10)
+        graph.attr(rankdir='LR')  # Set the orientation to Left to Right
+
+
+STAGES = {
+    'summary': summary_stage,
+    'fares': fares_stage,
+    'graph': graph_stage,
+    'prices': prices_stage,
+    'dot': dot_stage,
+}
+
+
+def run_file(file_path, name, stages, output_dir):
+    """
+    Parse one file and run the named stages over it, naming its outputs name. Returns {stage: result}
+    for the stages that return something to collect (summary, fares), with {stage: message} under
+    'errors' for stages that failed, or {'error': message} if the file cannot be parsed.
+    """
+    try:
+        with phase('parse'):
+            with open_netex(file_path) as source:
+                tree = etree.parse(source)
+        with phase('index'):
+            index = build_index(tree.getroot())
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, etree.XMLSyntaxError) as e:
+        return {'error': str(e)}
+    model = {
+        'file_path': file_path,
+        'name': name,
+        'tree': tree,
+        'root': tree.getroot(),
+        'index': index,
+    }
+
+    results = {}
+    for stage in stages:
+        try:
+            with phase(stage):
+                result = STAGES[stage](model, output_dir)
+        except Exception as e:
+            # one report failing on an unexpected document should not cost the file its other reports
+            results.setdefault('errors', {})[stage] = f"{type(e).__name__}: {e}"
+            continue
+        if result is not None:
+            results[stage] = result
+    return results
+
+
+def find_input_files(paths):
+    # (file path, output name); directories and zips are expanded to the NeTEx files in them
+    names = set()
+    for path in paths:
+        if os.path.isdir(path) or path.lower().endswith('.zip'):
+            found = [(os.path.join(root, filename), path) for root, filename in find_netex_files(path)]
+        else:
+            found = [(path, os.path.dirname(path))]
+        for file_path, top in found:
+            name = base = relative_source_name(file_path, top)
+            # the same relative path under two of the inputs
+            n = 1
+            while name in names:
+                n += 1
+                name = f"{base}_{n}"
+            names.add(name)
+            yield file_path, name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse NeTEx files once each and write any selection of reports from them.")
+    parser.add_argument('paths', nargs='+', help="Netex XML files (.xml, .xml.gz, .xml.bz2), or directories or .zip archives of them")
+    parser.add_argument('-r', '--reports', default='summary,fares', help=f"Comma separated stages to run, from {','.join(STAGES)} (default summary,fares)")
+    parser.add_argument('-o', '--output_dir', default='reports', help="Directory for the reports (default reports)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes to run files through the stages with (default 1)")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    stages = [stage.strip() for stage in args.reports.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown reports {', '.join(unknown)}, choose from {', '.join(STAGES)}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    inputs = list(find_input_files(args.paths))
+    file_paths = [file_path for file_path, _ in inputs]
+    names = [name for _, name in inputs]
+    run = partial(run_file, stages=stages, output_dir=args.output_dir)
+
+    # the worker pool and the report files are closed however the loop ends
+    with contextlib.ExitStack() as outputs:
+        if args.workers > 1:
+            # results come back in input order while later files are still being parsed
+            executor = outputs.enter_context(ProcessPoolExecutor(max_workers=args.workers))
+            results = executor.map(run, file_paths, names)
+        else:
+            results = map(run, file_paths, names)
+
+        summary_writer = fares_file = None
+        if 'summary' in stages:
+            summary_writer = csv.writer(outputs.enter_context(open(os.path.join(args.output_dir, 'summary.csv'), 'w', newline='')))
+            summary_writer.writerow(["productname", "productType", "triptype", "UserType", "farestructuretype", "linepubliccode", "operator", "has_zones","has_distancematrix","has_pricegroups","has_faretable","dir" ,"file"])
+        if 'fares' in stages:
+            fares_file = outputs.enter_context(open(os.path.join(args.output_dir, 'fares.jsonl'), 'w'))
+
+        files = failed = stage_failures = 0
+        for file_path, result in zip(file_paths, results):
+            files += 1
+            if 'error' in result:
+                failed += 1
+                print(f"Skipped {file_path}: {result['error']}")
+                continue
+            for stage, error in result.get('errors', {}).items():
+                stage_failures += 1
+                print(f"Failed {stage} for {file_path}: {error}")
+            print(f"Processed file: {file_path}")
+            if summary_writer is not None and 'summary' in result:
+                summary_writer.writerow(result['summary'])
+            if fares_file is not None and 'fares' in result:
+                fares_file.write(json.dumps(result['fares']) + '\n')
+
+    count('files', files)
+    print(f"{files} files, {failed} skipped, {stage_failures} failed reports, reports in {args.output_dir}")
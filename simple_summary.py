@@ -2,12 +2,27 @@ import xml.etree.ElementTree as ET
 import argparse
 import os
 import csv
+import json
+import hashlib
+import sqlite3
+import time
+from contextlib import ExitStack
+from functools import partial
+import netex_profile
+from netex_profile import count, phase, record_file
+from concurrent.futures import ProcessPoolExecutor
+from netex_sources import find_netex_files, open_netex, source_exists, source_stat
 
 
 def parse_netex_fares(file_path):
     # Parse the XML file
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    with open_netex(file_path) as source:
+        tree = ET.parse(source)
+    return summarise_root(tree.getroot())
+
+
+def summarise_root(root):
+    # the summary fields of an already parsed document, ElementTree or lxml
 
     # Define the Netex namespace
     ns = {'netex': 'http://www.netex.org.uk/netex'}
@@ -50,6 +65,215 @@ def parse_netex_fares(file_path):
 
     }
 
+
+NETEX_NS = '{http://www.netex.org.uk/netex}'
+
+# first element with this tag anywhere in the document -> text value
+STREAM_TEXT_FIELDS = {
+    'UserType': 'usertype',
+    'FareStructureType': 'farestructuretype',
+}
+
+# first element with this tag inside the first scope element -> (key, 'text' or attribute name)
+STREAM_SCOPED_FIELDS = {
+    'Line': {'PublicCode': ('linepubliccode', 'text')},
+    'fareProducts': {'Name': ('productname', 'text'), 'ProductType': ('producttype', 'text')},
+    'Tariff': {'TripType': ('triptype', 'text'), 'OperatorRef': ('operator', 'ref')},
+}
+
+# does an element with this tag exist anywhere in the document ?
+STREAM_FLAGS = {
+    'distanceMatrixElements': 'distancematrix',
+    'FareTable': 'faretable',
+    'priceGroups': 'pricegroups',
+    'fareZones': 'zones',
+}
+
+
+def parse_netex_fares_streaming(file_path):
+    """
+    Same result as parse_netex_fares, but collected in one forward iterparse pass.
+    Elements are dropped as soon as they close and reading stops once every field and
+    flag is settled. The gain is memory, not time: on the generated fare files FareTable comes
+    after the distance matrix, so the whole file is still read and this is no faster than the
+    DOM parse, but it holds a fraction of a megabyte where the tree takes tens.
+    benchmark.py --check compares the two on the sample file and generated files.
+    """
+    data = {key: None for key in STREAM_TEXT_FIELDS.values()}
+    for fields in STREAM_SCOPED_FIELDS.values():
+        data.update({key: None for key, _ in fields.values()})
+    data.update({key: False for key in STREAM_FLAGS.values()})
+
+    pending = set(data)
+    capturing = {}  # key -> element whose text we are waiting for
+    open_scopes = {}  # scope tag -> first element with that tag, while we are inside it
+    closed_scopes = set()
+    stack = []
+
+    with open_netex(file_path) as source:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            tag = elem.tag[len(NETEX_NS):] if elem.tag.startswith(NETEX_NS) else elem.tag
+
+            if event == 'start':
+                key = STREAM_FLAGS.get(tag)
+                if key in pending:
+                    data[key] = True
+                    pending.discard(key)
+
+                key = STREAM_TEXT_FIELDS.get(tag)
+                if key in pending and key not in capturing:
+                    capturing[key] = elem
+
+                for scope in open_scopes:
+                    if tag in STREAM_SCOPED_FIELDS[scope]:
+                        key, source_of_value = STREAM_SCOPED_FIELDS[scope][tag]
+                        if key not in pending or key in capturing:
+                            continue
+                        if source_of_value == 'text':
+                            capturing[key] = elem
+                        else:
+                            data[key] = elem.get(source_of_value)
+                            pending.discard(key)
+
+                if tag in STREAM_SCOPED_FIELDS and tag not in open_scopes and tag not in closed_scopes:
+                    open_scopes[tag] = elem
+
+                stack.append(elem)
+                continue
+
+            # end event: the element is complete, take what we need and drop it
+            stack.pop()
+            for key, captured in list(capturing.items()):
+                if captured is elem:
+                    data[key] = elem.text
+                    pending.discard(key)
+                    del capturing[key]
+
+            if open_scopes.get(tag) is elem:
+                # anything not found inside the scope stays None
+                del open_scopes[tag]
+                closed_scopes.add(tag)
+                for key, _ in STREAM_SCOPED_FIELDS[tag].values():
+                    pending.discard(key)
+
+            if stack:
+                stack[-1].remove(elem)
+            elem.clear()
+
+            if not pending:
+                break
+
+    return data
+
+
+def find_xml_files(dir):
+    # walk order decides the row order of the csv; .xml.gz, .xml.bz2 and the members of .zip files count too
+    yield from find_netex_files(dir)
+
+
+def timed_parse(parse, file_path):
+    # module level so it can be sent to worker processes
+    start = time.perf_counter()
+    data = parse(file_path)
+    return data, time.perf_counter() - start
+
+
+def file_sha1(file_path):
+    sha1 = hashlib.sha1()
+    with open_netex(file_path) as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load_manifest(manifest_path):
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest):
+    # write to the side and swap in, so an interrupted run never leaves a broken manifest
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def lookup_manifest(manifest, file_path, use_hash=False):
+    """
+    Return (data, entry) for a file. data is the cached summary if the file is unchanged
+    since it was last parsed, otherwise None. entry is the file's current fingerprint.
+    With use_hash a file whose mtime moved but whose content is the same still counts as unchanged.
+    """
+    size, mtime = source_stat(file_path)
+    entry = {'size': size, 'mtime': mtime}
+    cached = manifest.get(os.path.abspath(file_path))
+
+    if cached is not None and cached['size'] == entry['size']:
+        if cached['mtime'] == entry['mtime']:
+            if 'sha1' in cached:
+                entry['sha1'] = cached['sha1']
+            return cached['data'], entry
+        if use_hash:
+            entry['sha1'] = file_sha1(file_path)
+            if cached.get('sha1') == entry['sha1']:
+                return cached['data'], entry
+
+    if use_hash and 'sha1' not in entry:
+        entry['sha1'] = file_sha1(file_path)
+    return None, entry
+
+
+def summary_row(data, root, filename):
+    return [data['productname'], data['producttype'],data['triptype'] ,data['usertype'] ,data['farestructuretype'] ,data['linepubliccode'] , data['operator'], data['zones'], data['distancematrix'], data['pricegroups'], data['faretable'], root, filename ]
+
+
+# the csv columns, as stored in the sqlite summaries table; file_path is the key for upserts
+SUMMARY_COLUMNS = ["productname", "producttype", "triptype", "usertype", "farestructuretype", "linepubliccode", "operator", "has_zones", "has_distancematrix", "has_pricegroups", "has_faretable", "dir", "file"]
+SUMMARY_INDEXES = ["operator", "producttype", "usertype", "linepubliccode"]
+
+
+def open_summary_db(db_path):
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join(SUMMARY_COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS summaries (file_path TEXT PRIMARY KEY, {columns})")
+    for column in SUMMARY_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS summaries_{column} ON summaries ({column})")
+    conn.commit()
+    return conn
+
+
+def write_summary_rows(conn, rows):
+    """
+    Insert or update a batch of (file_path, summary_row) pairs in one transaction.
+    A file already in the table is updated in place, so a rerun over the same corpus does not add duplicates.
+    """
+    columns = ", ".join(SUMMARY_COLUMNS)
+    placeholders = ", ".join("?" * (len(SUMMARY_COLUMNS) + 1))
+    updates = ", ".join(f"{column} = excluded.{column}" for column in SUMMARY_COLUMNS)
+    with conn:
+        conn.executemany(
+            f"INSERT INTO summaries (file_path, {columns}) VALUES ({placeholders}) ON CONFLICT(file_path) DO UPDATE SET {updates}",
+            [[file_path] + row for file_path, row in rows])
+
+
+def prune_summary_rows(conn, root, file_paths):
+    """
+    Delete the rows of files under root that this scan did not find, and of files anywhere that no
+    longer exist. Rows of other existing files are kept, so a run over one sub directory leaves the
+    rest of the corpus alone. Returns the number of rows deleted.
+    """
+    root = os.path.abspath(root)
+    scanned = set(file_paths)
+    stale = [(file_path,) for (file_path,) in conn.execute("SELECT file_path FROM summaries")
+             if file_path not in scanned and (file_path == root or file_path.startswith(os.path.join(root, '')) or not source_exists(file_path))]
+    with conn:
+        conn.executemany("DELETE FROM summaries WHERE file_path = ?", stale)
+    return len(stale)
+
+
 if __name__ == "__main__":
  
     # Define the CSV file path
@@ -57,12 +281,22 @@ if __name__ == "__main__":
 
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Parse a Netex fares XML file and extract key fare information.")
-    parser.add_argument('file_dir', help="Path to the Netex fares XML directory")
+    parser.add_argument('file_dir', help="Path to the Netex fares XML directory, or a .zip of them")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes to parse files with (default 1)")
+    parser.add_argument('--cache', help="Manifest file of previous results; unchanged files are served from it instead of being parsed")
+    parser.add_argument('--hash', action='store_true', help="With --cache, also compare file contents when the modification time has changed")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase and per file to this file (default profile.json)")
+    parser.add_argument('--stream', action='store_true', help="Use the streaming parser, which keeps memory flat on large files (not faster) and stops reading once the summary fields are found")
+    parser.add_argument('--sqlite', help="Also write the rows to this sqlite database, updating rows for files already in it and removing those of files under file_dir that are gone")
+    parser.add_argument('--batch', type=int, default=1000, help="With --sqlite, rows per insert transaction (default 1000)")
 
     # Parse command-line arguments
     args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
 
     dir = args.file_dir
+    parse = parse_netex_fares_streaming if args.stream else parse_netex_fares
 
     # print(dir)
     # print(os.listdir(dir))
@@ -70,30 +304,65 @@ if __name__ == "__main__":
     # Define the CSV file path
     csv_file_path = 'output.csv'
 
-with open(csv_file_path, mode='w', newline='') as file:
-    # Create a CSV writer object
-    writer = csv.writer(file)
-
-    # Write the header row (column names)
-    writer.writerow(["productname", "productType", "triptype", "UserType", "farestructuretype", "linepubliccode", "operator", "has_zones","has_distancematrix","has_pricegroups","has_faretable","dir" ,"file"])
-
-    for root, dirs, files in os.walk(dir):
-    # for filename in os.listdir(dir):
-        # file_path = os.path.join(dir, filename)
-        for filename in files:
-            file_path = os.path.join(root, filename)
-        # if os.path.isfile(file_path):
-            print(f"Processing file: {file_path}")
-            if file_path.endswith('.xml'): 
-                # Parse the Netex fares file
-                data = parse_netex_fares(file_path)
-
-                # Display extracted information
-                # print ('productname', data['productname'])
-                # print ('productType', data['producttype'])
-                # print ('UserType', data['usertype'])
-                # print ('farestructuretype', data['farestructuretype']),
-                # print ('linepubliccode', data['linepubliccode']) 
-
-                writer.writerow([data['productname'], data['producttype'],data['triptype'] ,data['usertype'] ,data['farestructuretype'] ,data['linepubliccode'] , data['operator'], data['zones'], data['distancematrix'], data['pricegroups'], data['faretable'], root, filename ])
-    
+    # the stack shuts the worker pool down however the loop ends
+    with open(csv_file_path, mode='w', newline='') as file, ExitStack() as workers:
+        # Create a CSV writer object
+        writer = csv.writer(file)
+
+        # Write the header row (column names)
+        writer.writerow(["productname", "productType", "triptype", "UserType", "farestructuretype", "linepubliccode", "operator", "has_zones","has_distancematrix","has_pricegroups","has_faretable","dir" ,"file"])
+
+        conn = open_summary_db(args.sqlite) if args.sqlite else None
+        batch = []
+
+        with phase('scan'):
+            xml_files = list(find_xml_files(dir))
+            file_paths = [os.path.join(root, filename) for root, filename in xml_files]
+
+        # files not seen in this scan drop out of the manifest
+        with phase('manifest'):
+            manifest = load_manifest(args.cache)
+            new_manifest = {}
+            cached = []
+            for file_path in file_paths:
+                data, entry = lookup_manifest(manifest, file_path, args.hash)
+                new_manifest[os.path.abspath(file_path)] = entry
+                cached.append(data)
+            to_parse = [file_path for file_path, data in zip(file_paths, cached) if data is None]
+        count('files', len(file_paths))
+        count('parsed_files', len(to_parse))
+
+        if args.workers > 1:
+            # results come back in submission order, so the csv matches a serial run
+            executor = workers.enter_context(ProcessPoolExecutor(max_workers=args.workers))
+            chunksize = max(1, len(to_parse) // (args.workers * 8))
+            results = executor.map(partial(timed_parse, parse), to_parse, chunksize=chunksize)
+        else:
+            results = map(partial(timed_parse, parse), to_parse)
+
+        with phase('summarise'):
+            for (root, filename), file_path, data in zip(xml_files, file_paths, cached):
+                if data is None:
+                    print(f"Processing file: {file_path}")
+                    data, seconds = next(results)
+                    record_file(file_path, seconds)
+                else:
+                    print(f"Cached file: {file_path}")
+                new_manifest[os.path.abspath(file_path)]['data'] = data
+                row = summary_row(data, root, filename)
+                writer.writerow(row)
+                if conn is not None:
+                    batch.append((os.path.abspath(file_path), row))
+                    if len(batch) >= args.batch:
+                        write_summary_rows(conn, batch)
+                        batch = []
+
+        if conn is not None:
+            with phase('sqlite'):
+                write_summary_rows(conn, batch)
+                count('sqlite_removed', prune_summary_rows(conn, dir, [os.path.abspath(file_path) for file_path in file_paths]))
+            conn.close()
+
+    if args.cache:
+        with phase('save_manifest'):
+            save_manifest(args.cache, new_manifest)
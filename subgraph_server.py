@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from graphviz import Digraph
+
+from netex_document import load_document
+
+# Serves web7.html and DOT fragments of one NeTEx document held in memory, so the browser only
+# lays out what has been expanded instead of the whole of graph.dot.
+#
+#   GET /subgraph?node=<n>&depth=<d>&offset=<k>   the node and everything up to d levels below it
+#
+# Nodes are named n<node number> from netex_document, which stay the same for the life of the
+# server. Each response is json: a list of statements, each with a key (the node name, or
+# "a->b" for an edge), the DOT text and for edges the two ends. The page keeps the statements by
+# key, so expanding a node again replaces its statement rather than adding a copy. Nodes with
+# children that were not sent are filled grey and expand when clicked. A node with more than
+# --limit children gets a "more" node that fetches the next page of them.
+
+COLLAPSED = {'style': 'filled', 'fillcolor': 'lightgrey'}
+
+
+def strip_namespace(tag):
+    return tag.split('}', 1)[-1] if '}' in tag else tag
+
+
+def node_label(node):
+    lines = [strip_namespace(node.tag)] + [f"{key}: {value}" for key, value in node.attrib.items()]
+    text = node.text
+    if text:
+        lines.append(text if len(text) <= 40 else text[:37] + '...')
+    return "\n".join(lines)
+
+
+def statement(graph):
+    # the DOT text of the single statement just added to the graph
+    dot = graph.body.pop()
+    return dot.strip()
+
+
+def subgraph(document, ids, node_index, depth=1, offset=0, limit=50):
+    """
+    DOT statements for a node and its descendants down to depth levels, at most limit children per node.
+    offset skips the first children of the top node, for paging through long lists.
+    """
+    graph = Digraph()
+    statements = []
+
+    def add_node(node, collapsed):
+        graph.node(f"n{node.index}", node_label(node), **(COLLAPSED if collapsed else {}))
+        statements.append({'key': f"n{node.index}", 'dot': statement(graph)})
+
+    def add_edge(start, end, **attrs):
+        key = f"{start}->{end}"
+        graph.edge(start, end, id=key, **attrs)
+        statements.append({'key': key, 'dot': statement(graph), 'from': start, 'to': end})
+
+    def visit(node, level, skip):
+        children = node.children
+        shown = children[skip:skip + limit] if level < depth else []
+        add_node(node, collapsed=bool(children) and not shown)
+        for child in shown:
+            visit(child, level + 1, 0)
+            add_edge(f"n{node.index}", f"n{child.index}")
+        if shown and skip + limit < len(children):
+            more = f"m{node.index}_{skip + limit}"
+            graph.node(more, f"{len(children) - skip - limit} more", shape='box', style='dashed')
+            statements.append({'key': more, 'dot': statement(graph)})
+            add_edge(f"n{node.index}", more, style='dashed')
+
+        # reference edges, the page only draws them once both ends are on screen
+        for key, value in node.attrib.items():
+            if 'ref' in key.lower() and value in ids:
+                add_edge(f"n{node.index}", f"n{ids[value]}", style='dashed', color='blue')
+
+    visit(document.node(node_index), 0, offset)
+    return statements
+
+
+def make_handler(document, ids, start_index, page_path, limit):
+
+    class SubgraphHandler(BaseHTTPRequestHandler):
+        def send_body(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_json(self, status, body):
+            self.send_body(status, json.dumps(body).encode('utf-8'), 'application/json')
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+            if url.path in ('/', '/web7.html'):
+                with open(page_path, 'rb') as f:
+                    self.send_body(200, f.read(), 'text/html; charset=utf-8')
+                return
+            if url.path != '/subgraph':
+                self.send_json(404, {'error': f"unknown path {url.path}"})
+                return
+
+            try:
+                node_index = int(query.get('node', start_index))
+                depth = int(query.get('depth', 1))
+                offset = int(query.get('offset', 0))
+            except ValueError:
+                self.send_json(400, {'error': "node, depth and offset must be numbers"})
+                return
+            if not 0 <= node_index < len(document):
+                self.send_json(404, {'error': f"no node {node_index}"})
+                return
+
+            self.send_json(200, {'root': f"n{node_index}", 'statements': subgraph(document, ids, node_index, depth, offset, limit)})
+
+        def log_message(self, format, *args):
+            if not self.server.quiet:
+                super().log_message(format, *args)
+
+    return SubgraphHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse a NeTEx file in web7.html, expanding nodes on demand.")
+    parser.add_argument('netex_file', nargs='?', default="./RBUS_X4_Outbound_BoostSingle.xml", help="Netex XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('--start_tag', default='dataObjects', help="Tag of the node the page starts from (default dataObjects)")
+    parser.add_argument('--limit', type=int, default=50, help="Children sent per node before a 'more' node is added (default 50)")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8086, help="Port to listen on (default 8086)")
+    parser.add_argument('--quiet', action='store_true', help="Do not log each request")
+    args = parser.parse_args()
+
+    document = load_document(args.netex_file)
+    ids = {}
+    for node in document.root.iter():
+        ids.setdefault(node.get('id'), node.index)
+    ids.pop(None, None)
+    start_index = next((node.index for node in document.root.iter() if strip_namespace(node.tag) == args.start_tag), 0)
+
+    page_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web7.html')
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(document, ids, start_index, page_path, args.limit))
+    server.quiet = args.quiet
+    print(f"{len(document)} elements loaded, browse http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
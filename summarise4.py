@@ -1,83 +1,66 @@
-import xml.etree.ElementTree as ET
 import argparse
+import netex_profile
+from netex_profile import count
+from netex_extract import compile_spec, extract
+
+FARES_SPEC = {
+    None: {
+        'fields': {
+            'usertype': ('UserType', 'text'),
+            'producttype': ('ProductType', 'text'),
+            'farestructuretype': ('FareStructureType', 'text'),
+        },
+    },
+    'Tariff': {
+        'into': 'tariffs',
+        'fields': {
+            'tariff_id': (None, 'id'),
+            'tariff_name': ('Name', 'text'),
+            'tariff_type': ('TypeOfTariffRef', 'ref'),
+        },
+    },
+    'FareStructureElement': {
+        'into': 'fare_structure_elements',
+        'fields': {
+            'element_id': (None, 'id'),
+            'element_name': ('Name', 'text'),
+            'fare_structure_type': ('TypeOfFareStructureElementRef', 'ref'),
+        },
+    },
+    # distance matrix elements within each fare structure element
+    'DistanceMatrixElement': {
+        'into': 'distance_matrix_elements',
+        'parent': 'FareStructureElement',
+        'fields': {
+            'start_zone': ('StartTariffZoneRef', 'ref'),
+            'end_zone': ('EndTariffZoneRef', 'ref'),
+            'price_groups': ('PriceGroupRef', 'ref', 'all'),
+        },
+    },
+}
+
+FARES_EXTRACTION = compile_spec(FARES_SPEC)
 
 def parse_netex_fares(file_path):
-    # Parse the XML file
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    # Define the Netex namespace
-    ns = {'netex': 'http://www.netex.org.uk/netex'}
-
-    # Initialize data structures to hold information
-    tariffs = []
-    fare_structure_elements = []
-
-    # Extracting tariffs and their types
-    for tariff in root.findall('.//netex:Tariff', ns):
-        tariff_id = tariff.get('id')
-        tariff_name = tariff.find('.//netex:Name', ns).text if tariff.find('.//netex:Name', ns) is not None else None
-        tariff_type = tariff.find('.//netex:TypeOfTariffRef', ns).get('ref') if tariff.find('.//netex:TypeOfTariffRef', ns) is not None else None
-
-        tariffs.append({
-            'tariff_id': tariff_id,
-            'tariff_name': tariff_name,
-            'tariff_type': tariff_type
-        })
-
-    # Extracting fare structure elements
-    for fare_element in root.findall('.//netex:FareStructureElement', ns):
-        element_id = fare_element.get('id')
-        element_name = fare_element.find('.//netex:Name', ns).text if fare_element.find('.//netex:Name', ns) is not None else None
-        fare_structure_type = fare_element.find('.//netex:TypeOfFareStructureElementRef', ns).get('ref') if fare_element.find('.//netex:TypeOfFareStructureElementRef', ns) is not None else None
-
-        # Extracting distance matrix elements within each fare structure element
-        distance_matrix_elements = []
-        for distance_matrix in fare_element.findall('.//netex:DistanceMatrixElement', ns):
-            start_zone = distance_matrix.find('.//netex:StartTariffZoneRef', ns).get('ref') if distance_matrix.find('.//netex:StartTariffZoneRef', ns) is not None else None
-            end_zone = distance_matrix.find('.//netex:EndTariffZoneRef', ns).get('ref') if distance_matrix.find('.//netex:EndTariffZoneRef', ns) is not None else None
-
-            # Extracting price group references if available
-            price_groups = []
-            for price_group in distance_matrix.findall('.//netex:PriceGroupRef', ns):
-                price_groups.append(price_group.get('ref'))
-
-            distance_matrix_elements.append({
-                'start_zone': start_zone,
-                'end_zone': end_zone,
-                'price_groups': price_groups
-            })
-
-        fare_structure_elements.append({
-            'element_id': element_id,
-            'element_name': element_name,
-            'fare_structure_type': fare_structure_type,
-            'distance_matrix_elements': distance_matrix_elements
-        })
-
-    usertype = (root.find('.//netex:UserType', ns)).text
-    producttype = (root.find('.//netex:ProductType', ns)).text
-    farestructuretype = (root.find('.//netex:FareStructureType', ns)).text
-    lineref = root.find('.//netex:LineRef', ns)
-    
-    return {
-        'tariffs': tariffs,
-        'fare_structure_elements': fare_structure_elements,
-        'usertype': usertype,
-        'producttype': producttype,
-        'farestructuretype': farestructuretype
-    }
+    # One pass over the file fills tariffs, fare structure elements and their distance matrix elements
+    return extract(file_path, FARES_EXTRACTION)
 
 if __name__ == "__main__":
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Parse a Netex fares XML file and extract key fare information.")
-    parser.add_argument('file_path', help="Path to the Netex fares XML file")
+    parser.add_argument('file_path', help="Path to the Netex fares XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
 
     # Parse command-line arguments
     args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
     
     # Parse the Netex fares file
     data = parse_netex_fares(args.file_path)
+    count('tariffs', len(data['tariffs']))
+    count('fare_structure_elements', len(data['fare_structure_elements']))
+    count('distance_matrix_elements', sum(len(element['distance_matrix_elements']) for element in data['fare_structure_elements']))
 
     # Display extracted information
     print("Tariff Information:")
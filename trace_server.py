@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from lxml import etree
+
+from netex_index import build_index
+from netex_sources import open_netex, source_stat, split_archive_path
+from tracer5 import trace_fare
+
+# A long running local HTTP service around tracer5.trace_fare.
+#
+#   GET /trace?file=<path>&start=<stop id>[&end=<stop id>]   -> {"path": [...], "amount": ..., "problem": ...}
+#   GET /stats                                                -> cache hit / miss statistics
+#
+# Parsed documents and their id/ref indexes stay in an LRU cache bounded by an estimate of their
+# memory use, so repeated queries against the same few files skip the parse. The estimate is
+# DOCUMENT_BYTES_PER_SOURCE_BYTE times the uncompressed size of the source, not measured memory,
+# so --cache_mb is a rough budget. A file whose size or mtime changed since it was cached is
+# parsed again. Only files under --root are served.
+
+# an lxml tree plus build_index takes about ten times the size of the uncompressed source
+DOCUMENT_BYTES_PER_SOURCE_BYTE = 10
+
+
+class DocumentCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.documents = OrderedDict()  # path -> (fingerprint, tree, index, estimated bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.loading = {}  # path -> lock, so concurrent requests for a new file parse it once
+
+    def get(self, file_path):
+        fingerprint = source_stat(file_path)
+        with self.lock:
+            cached = self.documents.get(file_path)
+            if cached is not None and cached[0] == fingerprint:
+                self.documents.move_to_end(file_path)
+                self.hits += 1
+                return cached[1], cached[2]
+            file_lock = self.loading.setdefault(file_path, threading.Lock())
+
+        with file_lock:
+            with self.lock:
+                # another request may have loaded it while we waited
+                cached = self.documents.get(file_path)
+                if cached is not None and cached[0] == fingerprint:
+                    self.documents.move_to_end(file_path)
+                    self.hits += 1
+                    return cached[1], cached[2]
+                self.misses += 1
+
+            try:
+                with open_netex(file_path) as source:
+                    tree = etree.parse(source)
+                    # the position of a .gz, .bz2 or zip member stream counts uncompressed bytes, so
+                    # compressed sources are not undercounted by their compression ratio
+                    size = source.tell() * DOCUMENT_BYTES_PER_SOURCE_BYTE
+                index = build_index(tree.getroot())
+
+                with self.lock:
+                    if file_path in self.documents:
+                        self.bytes -= self.documents.pop(file_path)[3]
+                    self.documents[file_path] = (fingerprint, tree, index, size)
+                    self.bytes += size
+                    # least recently used first, but always keep the document just loaded
+                    while self.bytes > self.max_bytes and len(self.documents) > 1:
+                        _, evicted = self.documents.popitem(last=False)
+                        self.bytes -= evicted[3]
+                        self.evictions += 1
+            finally:
+                # requests already waiting hold the lock itself, later ones find the document cached
+                with self.lock:
+                    if self.loading.get(file_path) is file_lock:
+                        del self.loading[file_path]
+            return tree, index
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'documents': list(self.documents),
+                'estimated_bytes': self.bytes,
+                'max_estimated_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+
+def make_handler(cache, root):
+    root = os.path.realpath(root)
+
+    class TraceHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+            if url.path == '/stats':
+                self.send_json(200, cache.stats())
+                return
+            if url.path != '/trace':
+                self.send_json(404, {'error': f"unknown path {url.path}"})
+                return
+            if 'file' not in query or 'start' not in query:
+                self.send_json(400, {'error': "file and start are required"})
+                return
+
+            file_path = os.path.realpath(os.path.join(root, query['file']))
+            if os.path.commonpath([root, file_path]) != root or not os.path.isfile(split_archive_path(file_path)[0]):
+                self.send_json(404, {'error': f"no such file {query['file']}"})
+                return
+
+            try:
+                _, index = cache.get(file_path)
+            except KeyError:
+                self.send_json(404, {'error': f"no such file {query['file']}"})
+                return
+            except (OSError, ValueError, zipfile.BadZipFile, etree.XMLSyntaxError) as e:
+                self.send_json(422, {'error': f"cannot parse {query['file']}: {e}"})
+                return
+
+            try:
+                path, problem = trace_fare(index, query['start'], query.get('end'))
+            except Exception as e:
+                # a document shaped differently from what trace_fare expects, the server carries on
+                self.send_json(500, {'error': f"trace failed in {query['file']}: {type(e).__name__}: {e}"})
+                return
+            self.send_json(200, {
+                'file': query['file'],
+                'start': query['start'],
+                'end': query.get('end'),
+                'path': [{'tag': re.sub(r'^.*?}', '', tag), 'id': elem_id, 'details': details} for tag, elem_id, details in path],
+                'amount': path[-1][2] if path and problem is None else None,
+                'problem': problem,
+            })
+
+        def log_message(self, format, *args):
+            if not self.server.quiet:
+                super().log_message(format, *args)
+
+    return TraceHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve tracer5 fare traces over HTTP, keeping parsed NeTEx files in memory.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8085, help="Port to listen on (default 8085)")
+    parser.add_argument('--root', default='.', help="Directory the file parameter is resolved against, nothing outside it is served")
+    parser.add_argument('--cache_mb', type=int, default=512, help="Cache budget in MB, counted as 10 times the uncompressed size of each source file rather than measured memory (default 512)")
+    parser.add_argument('--quiet', action='store_true', help="Do not log each request")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(DocumentCache(args.cache_mb * 1024 * 1024), args.root))
+    server.quiet = args.quiet
+    print(f"Serving fare traces for {os.path.abspath(args.root)} on http://{args.host}:{args.port}/trace")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
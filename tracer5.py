@@ -1,17 +1,34 @@
 from lxml import etree
 import re
 import argparse
+import csv
+import json
+import zipfile
+import numpy as np
+import netex_profile
+from netex_profile import count, phase
+from netex_index import build_index, find_by_id, find_referring
+from netex_queries import containing_fare_structure_element
+from netex_sources import open_netex
+
+NETEX = '{http://www.netex.org.uk/netex}'
+
+# what a trace reads, for load_selective: these subtrees are kept whole, the shell tags keep their
+# attributes only, and every other element is kept as an attribute-only shell if it is an ancestor of
+# something kept (the frames and FareStructureElements that place it) and dropped otherwise
+TRACE_SUBTREES = {NETEX + 'FareZone', NETEX + 'DistanceMatrixElement', NETEX + 'PriceGroup'}
+TRACE_SHELLS = {NETEX + 'ScheduledStopPoint'}
 
 
 def cleanse(label):
     return re.sub(r'^.*?}','',label)
 
-def find_fare_zone_for_stop(stop_id):
+def find_fare_zone_for_stop(stop_id, index):
     """
     Locate the FareZone containing the specified ScheduledStopPoint by navigating upwards.
     """
     # Find the ScheduledStopPointRef element with the specified stop_id
-    stop_ref = tree.xpath(f"//netex:ScheduledStopPointRef[@ref='{stop_id}']", namespaces= ns)
+    stop_ref = find_referring(index, stop_id, NETEX + 'ScheduledStopPointRef')
     
     # If the stop reference is not found, return None
     if not stop_ref:
@@ -22,65 +39,295 @@ def find_fare_zone_for_stop(stop_id):
 
     return fare_zone
 
-def find_first_distance_matrix_element( start_zone_id):
+def fare_zones_for_stop(stop_id, index):
+    # every FareZone the stop is a member of, in document order
+    fare_zones = []
+    for stop_ref in find_referring(index, stop_id, NETEX + 'ScheduledStopPointRef'):
+        fare_zone = stop_ref.getparent().getparent()
+        if fare_zone is not None and fare_zone.tag == NETEX + 'FareZone':
+            fare_zones.append(fare_zone)
+    return fare_zones
+
+def find_first_distance_matrix_element( start_zone_id, index, end_zone_ids=None):
     """
-    Find the first DistanceMatrixElement for the given FareZone ID.
+    Find the first DistanceMatrixElement for the given FareZone ID, optionally only those ending in one of end_zone_ids.
     """
     # Find DistanceMatrixElement with matching StartTariffZoneRef
-    element =  tree.xpath(f"//netex:DistanceMatrixElement[netex:StartTariffZoneRef[@ref='{start_zone_id}']]", namespaces= ns)
+    element = [zone_ref.getparent() for zone_ref in find_referring(index, start_zone_id, NETEX + 'StartTariffZoneRef')
+               if zone_ref.getparent().tag == NETEX + 'DistanceMatrixElement']
+    if end_zone_ids is not None:
+        element = [candidate for candidate in element
+                   if candidate.find(NETEX + 'EndTariffZoneRef') is not None and candidate.find(NETEX + 'EndTariffZoneRef').get('ref') in end_zone_ids]
     
     # Return the first match if available
     return element[0] if element else None
 
-def find_containing_fse_unused(obj_ref):
-    # get all fareStructureElement objects
-    tariff = tree.find(".//netex:Tariff", namespaces= ns)
-    fareStructureElements = tariff.findall(".//netex:FareStructureElement", namespaces= ns)
-    print(f"found {len(fareStructureElements)} fareStructureElements")
-
-    for fareStructureElement in fareStructureElements:
-        elements = fareStructureElement.xpath(f".//netex:*[@ref='{obj_ref.get('id')}']", namespaces= ns)
-        
-        for element in elements:
-            print(f"found {cleanse(obj_ref.tag)} in  {cleanse(element.tag)} in FareStructureElement {fareStructureElement.get('id')}")
-            return(element)
-        
-    return None
-   
-    # Return the first match if available
-    # return elements[0] if elements else None
-
-
-def find_containing_fse(obj_ref):
+def find_containing_fse(obj_ref, index):
+    """
+    The FareStructureElement holding the first reference to obj_ref, None if nothing refers to it
+    or no reference sits inside a FareStructureElement.
+    """
     if obj_ref.tag == "fateStructureElement":
         # pull up we are back at the FSE 
         return None
-    elements = tree.xpath(f".//netex:*[@ref='{obj_ref.get('id')}']", namespaces= ns)
+    elements = find_referring(index, obj_ref.get('id'))
+    if not elements:
+        # nothing refers to the object, so there is no chain to follow up
+        return None
     print(f"found {len(elements)} references to {obj_ref}.  Target object is {elements[0]}")
-    # iterating up the chain
-    focus = elements[0]
-    while focus.tag != "{http://www.netex.org.uk/netex}FareStructureElement":
-        parent = focus.getparent()
-        print(f"parent of {cleanse(focus.tag)} is {cleanse(parent.tag)}")
-        focus = parent
-          
-
-def find_price_group_for_distance_matrix( element):
+    for element in elements:
+        fare_structure_element = containing_fare_structure_element(element)
+        if fare_structure_element is not None:
+            print(f"found {cleanse(obj_ref.tag)} in {cleanse(element.tag)} in FareStructureElement {fare_structure_element.get('id')}")
+            return fare_structure_element
+    return None
+
+
+def find_price_group_for_distance_matrix( element, index):
     # Find price group information from the PriceGroupRef in DistanceMatrixElement.
-    price_group_ref = element.find(".//netex:PriceGroupRef", namespaces= ns)
+    price_group_ref = element.find(".//" + NETEX + "PriceGroupRef")
     
     if price_group_ref is not None:
         ref = price_group_ref.get('ref')
-        price_group =  tree.xpath(f".//netex:PriceGroup[@id='{ref}']", namespaces= ns)
-        return price_group[0] if price_group else None
+        return find_by_id(index, ref, NETEX + 'PriceGroup')
     return "No price group"
 
 def find_amount_for_price_group( element):
-    amount = element.find(".//netex:Amount", namespaces= ns)
+    amount = element.find(".//" + NETEX + "Amount")
+    if amount is None:
+        return None
     price_holder_type = amount.getparent().tag
     price_holder_id = amount.getparent().get('id')
     return amount.text, price_holder_type, price_holder_id
 
+def price_for_distance_matrix(element, index):
+    # Amount of the first PriceGroup referenced by a DistanceMatrixElement, or None if the chain is broken
+    price_group_ref = element.find(".//" + NETEX + "PriceGroupRef")
+    if price_group_ref is None:
+        return None
+    price_group = find_by_id(index, price_group_ref.get('ref'), NETEX + 'PriceGroup')
+    if price_group is None:
+        return None
+    amount = price_group.find(".//" + NETEX + "Amount")
+    if amount is None or amount.text is None:
+        return None
+    return float(amount.text)
+
+def load_selective(source):
+    """
+    Stream a document with iterparse and keep only what a trace needs (TRACE_SUBTREES, TRACE_SHELLS and
+    their ancestors), dropping everything else as soon as it ends. Memory grows with the fare zones,
+    distance matrix and price groups rather than with the whole file. trace_fare, all_pairs_price_matrix
+    and build_index work on the result as on a full parse, except that references from the dropped
+    parts (FareTable columns, for instance) are not there to find.
+    """
+    inside = 0  # depth within a kept subtree
+    for event, elem in etree.iterparse(source, events=('start', 'end'), remove_comments=True, remove_pis=True):
+        if event == 'start':
+            if inside or elem.tag in TRACE_SUBTREES:
+                inside += 1
+            continue
+        if inside:
+            inside -= 1
+            continue
+        parent = elem.getparent()
+        if elem.tag in TRACE_SHELLS or len(elem) or parent is None:
+            # a shell, or holds something kept further down; any children of a shell ended before it and were dropped
+            elem.text = elem.tail = None
+            continue
+        parent.remove(elem)
+    return elem.getroottree()
+
+def stop_zone_memberships(tree, index):
+    """
+    Every (stop, zone) membership, taken from the ScheduledStopPointRefs inside FareZones.
+    Returns (stop_ids, stop_index, zone_ids, member_stop, member_zone): stop_index maps stop id -> number,
+    zone_ids maps zone id -> number in order of first membership, and member_stop[k] is in member_zone[k].
+    """
+    stop_ids = [stop.get('id') for stop in tree.iter(NETEX + 'ScheduledStopPoint')]
+    stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+    zone_ids = {}
+    member_stop = []
+    member_zone = []
+    for stop_id, i in stop_index.items():
+        for stop_ref in find_referring(index, stop_id, NETEX + 'ScheduledStopPointRef'):
+            fare_zone = stop_ref.getparent().getparent()
+            if fare_zone is None or fare_zone.tag != NETEX + 'FareZone':
+                continue
+            member_stop.append(i)
+            member_zone.append(zone_ids.setdefault(fare_zone.get('id'), len(zone_ids)))
+    return stop_ids, stop_index, zone_ids, member_stop, member_zone
+
+def all_pairs_price_matrix(tree, index):
+    """
+    Resolve every ScheduledStopPoint pair to a price in one go.
+    Returns (prices, stop_ids, stop_index) where prices[i, j] is the amount from stop_ids[i]
+    to stop_ids[j] (NaN if no DistanceMatrixElement links their zones) and stop_index maps id -> row.
+    As in the single trace, the first DistanceMatrixElement in the document wins for a zone pair.
+    """
+    stop_ids, stop_index, zone_ids, member_stop, member_zone = stop_zone_memberships(tree, index)
+
+    # zone x zone price, remembering document order so the first element wins
+    n_zones = len(zone_ids)
+    zone_price = np.full((n_zones, n_zones), np.nan)
+    zone_order = np.full((n_zones, n_zones), np.inf)
+    for order, element in enumerate(tree.iter(NETEX + 'DistanceMatrixElement')):
+        start_ref = element.find(NETEX + 'StartTariffZoneRef')
+        end_ref = element.find(NETEX + 'EndTariffZoneRef')
+        if start_ref is None or end_ref is None:
+            continue
+        start = zone_ids.get(start_ref.get('ref'))
+        end = zone_ids.get(end_ref.get('ref'))
+        if start is None or end is None or zone_order[start, end] < order:
+            continue
+        price = price_for_distance_matrix(element, index)
+        zone_order[start, end] = order
+        zone_price[start, end] = price if price is not None else np.nan
+
+    # cross every start membership with every end membership, keep the earliest element per stop pair
+    prices = np.full((len(stop_ids), len(stop_ids)), np.nan)
+    member_stop = np.asarray(member_stop, dtype=np.intp)
+    member_zone = np.asarray(member_zone, dtype=np.intp)
+    starts, ends = np.meshgrid(np.arange(len(member_zone)), np.arange(len(member_zone)), indexing='ij')
+    starts, ends = starts.ravel(), ends.ravel()
+    order = zone_order[member_zone[starts], member_zone[ends]]
+    found = np.isfinite(order)
+    starts, ends, order = starts[found], ends[found], order[found]
+    pair = member_stop[starts] * len(stop_ids) + member_stop[ends]
+    by_order = np.argsort(order, kind='stable')
+    pair, first = np.unique(pair[by_order], return_index=True)
+    first = by_order[first]
+    prices.flat[pair] = zone_price[member_zone[starts[first]], member_zone[ends[first]]]
+
+    return prices, stop_ids, stop_index
+
+def write_price_matrix_csv(csv_path, prices, stop_ids):
+    with open(csv_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['stop'] + stop_ids)
+        for stop_id, row in zip(stop_ids, prices):
+            writer.writerow([stop_id] + ['' if np.isnan(price) else price for price in row])
+
+def write_price_matrix_npy(npy_path, prices, stop_ids):
+    # the stop ids go alongside as <name>_stops.npy so row/column numbers can be looked up again
+    np.save(npy_path, prices)
+    np.save(re.sub(r'\.npy$', '', npy_path) + '_stops.npy', np.array(stop_ids))
+
+def trace_fare(index, start_stop_id, end_stop_id=None):
+    """
+    Follow a stop through FareZone, DistanceMatrixElement and PriceGroup to an amount.
+    Returns (path, problem): path is a list of (tag, id, details) with the amount as the details of the
+    last step, problem is None or a message saying where the chain broke.
+    Without an end stop the first DistanceMatrixElement from the stop's first zone is used, with one
+    the first element from any of the start stop's zones to any of the end stop's zones.
+    """
+    path = []  # Track path of elements for tracing purposes
+
+    # Step 1: Find the FareZone containing the stop
+    if end_stop_id is None:
+        fare_zone = find_fare_zone_for_stop(start_stop_id, index)
+        fare_zones = [fare_zone] if fare_zone is not None else []
+        end_zone_ids = None
+    else:
+        fare_zones = fare_zones_for_stop(start_stop_id, index)
+        end_zone_ids = {end_zone.get('id') for end_zone in fare_zones_for_stop(end_stop_id, index)}
+        if not end_zone_ids:
+            return path, f"No FareZone found for stop ID: {end_stop_id}"
+    if not fare_zones:
+        return path, f"No FareZone found for stop ID: {start_stop_id}"
+
+    # Step 2: Find the first DistanceMatrixElement for this FareZone
+    # first try for case of a OD matrix
+    fare_zone, distance_matrix_element = fare_zones[0], None
+    for candidate in fare_zones:
+        distance_matrix_element = find_first_distance_matrix_element(candidate.get("id"), index, end_zone_ids)
+        if distance_matrix_element is not None:
+            fare_zone = candidate
+            break
+
+    zone_name = fare_zone.find(NETEX + "Name").text if fare_zone.find(NETEX + "Name") is not None else "Unknown Zone"
+    path.append((fare_zone.tag, fare_zone.get("id"), zone_name))
+    if distance_matrix_element is None:
+        return path, "No DistanceMatrixElement found from the starting FareZone."
+
+    # Get end zone and price
+    end_zone_ref = distance_matrix_element.find(".//" + NETEX + "EndTariffZoneRef")
+    if end_zone_ref is None:
+        return path, "No end zone reference found in DistanceMatrixElement."
+
+    end_zone_id = end_zone_ref.get("ref")
+    details = f"To Zone ID: {end_zone_id}" if end_stop_id is not None else f"Example To Zone ID: {end_zone_id}"
+    path.append((distance_matrix_element.tag, distance_matrix_element.get("id"), details))
+
+    price_group = find_price_group_for_distance_matrix(distance_matrix_element, index)
+    if price_group == "No price group" or price_group is None:
+        return path, "No price_group found price_group."
+    path.append((price_group.tag, price_group.get("id"), ''))
+
+    found = find_amount_for_price_group(price_group)
+    if found is None:
+        return path, f"No Amount found for PriceGroup {price_group.get('id')}"
+    amount, price_holder_type, price_holder_id = found
+    path.append((price_holder_type, price_holder_id, amount))
+    return path, None
+
+def read_trace_requests(batch_path):
+    # csv with a file,start_stop,end_stop header, or jsonl objects with the same keys; end_stop may be empty
+    with open(batch_path, newline='') as f:
+        if batch_path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [{'file': row['file'], 'start_stop': row['start_stop'], 'end_stop': row.get('end_stop') or None} for row in rows]
+
+def trace_batch(requests, selective=False):
+    """
+    Trace many stop pairs, parsing each file once. Returns one result per request, in request order,
+    with the trace path and either the amount or the problem that stopped the trace.
+    With selective each file is read with load_selective instead of kept whole.
+    """
+    by_file = {}
+    for i, request in enumerate(requests):
+        by_file.setdefault(request['file'], []).append(i)
+
+    results = [None] * len(requests)
+    for file_path, positions in by_file.items():
+        with phase('parse'):
+            try:
+                with open_netex(file_path) as source:
+                    tree = load_selective(source) if selective else etree.parse(source)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile, etree.XMLSyntaxError) as e:
+                tree, problem = None, f"Cannot read {file_path}: {e}"
+        if tree is not None:
+            with phase('index'):
+                index = build_index(tree.getroot())
+        count('files', 1)
+
+        with phase('trace'):
+            for i in positions:
+                request = requests[i]
+                path, problem = trace_fare(index, request['start_stop'], request['end_stop']) if tree is not None else ([], problem)
+                results[i] = dict(request,
+                                  amount=path[-1][2] if path and problem is None else None,
+                                  problem=problem,
+                                  path=[(cleanse(tag), elem_id, details) for tag, elem_id, details in path])
+    count('traces', len(requests))
+    return results
+
+def write_trace_results(output_path, results):
+    if output_path.endswith('.jsonl'):
+        with open(output_path, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        return
+    with open(output_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['file', 'start_stop', 'end_stop', 'status', 'amount', 'problem', 'path'])
+        for result in results:
+            writer.writerow([result['file'], result['start_stop'], result['end_stop'] or '',
+                             'failed' if result['problem'] else 'ok', result['amount'] or '', result['problem'] or '',
+                             ' > '.join(f"{tag}:{elem_id}" for tag, elem_id, _ in result['path'])])
+
 def follow_single_link_to_price( start_stop_id):
     # Trace a single path from a ScheduledStopPoint to the first price found, printing all linking objects.
     path = []  # Track path of elements for tracing purposes
@@ -89,12 +336,29 @@ def follow_single_link_to_price( start_stop_id):
     
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="within a single netex file, trace from a stop through to an assocoiated fare price to check the structure of the xml..")
-    parser.add_argument('-f','--file_path', help="Netex fares XML file")
+    parser.add_argument('-f','--file_path', help="Netex fares XML file, .xml.gz / .xml.bz2 or archive.zip/member.xml")
     parser.add_argument('-s','--start_stop', help="Start stop id")
     parser.add_argument('-e','--end_stop', help="End stop id")
+    parser.add_argument('--all_pairs', action='store_true', help="Resolve the price for every stop pair instead of tracing one stop")
+    parser.add_argument('--matrix_csv', help="With --all_pairs, write the stop x stop price matrix to this csv file")
+    parser.add_argument('--profile', nargs='?', const='profile.json', help="Write a json report of time and memory per phase to this file (default profile.json)")
+    parser.add_argument('--matrix_npy', help="With --all_pairs, write the stop x stop price matrix to this .npy file")
+    parser.add_argument('--batch', help="Trace every file,start_stop,end_stop row of this csv or jsonl file instead of a single stop, parsing each file once")
+    parser.add_argument('--batch_output', default='traces.csv', help="With --batch, write one result per row to this csv or jsonl file (default traces.csv)")
+    parser.add_argument('--selective', action='store_true', help="Keep only the fare zones, distance matrix and price groups while reading, for files too large to hold whole")
 
     # Parse command-line arguments
     args = parser.parse_args()
+    if args.profile:
+        netex_profile.enable(args.profile)
+
+    if args.batch:
+        results = trace_batch(read_trace_requests(args.batch), args.selective)
+        with phase('export'):
+            write_trace_results(args.batch_output, results)
+        failed = sum(1 for result in results if result['problem'])
+        print(f"Traced {len(results)} stop pairs, {failed} failed, results in {args.batch_output}")
+        quit()
 
     file_path = args.file_path
     start_stop_id = args.start_stop
@@ -104,60 +368,47 @@ if __name__ == "__main__":
     print(start_stop_id)
     print(end_stop_id)
 
-    tree = etree.parse(file_path)
+    try:
+        with phase('parse'):
+            with open_netex(file_path) as source:
+                tree = load_selective(source) if args.selective else etree.parse(source)
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        # no such file or member, or a .zip of several files given without naming one
+        parser.error(str(e).strip('"'))
     ns = {'netex': 'http://www.netex.org.uk/netex'}  # Define the namespace
+    with phase('index'):
+        index = build_index(tree.getroot())  # id and ref lookups for every step of the trace
+    count('ids', len(index['ids']))
+    count('refs', sum(len(elements) for elements in index['refs'].values()))
 
-    path = []  # Track path of elements for tracing purposes
-
-    if start_stop_id is None:
-        # find a stop, any stop
-        start_stop_id = tree.find(".//netex:ScheduledStopPoint", namespaces= ns).get('id')
-
-    print(f"Starting traversal from stop ID: {start_stop_id}")
-    # Step 1: Find the FareZone containing the stop
-    fare_zone =  find_fare_zone_for_stop(start_stop_id)
-    if fare_zone is None:
-        print(f"No FareZone found for stop ID: {start_stop_id}")
-        quit()
-    
-    start_zone_id = fare_zone.get("id")
-    zone_name = fare_zone.find("netex:Name", namespaces= ns).text if fare_zone.find("netex:Name", namespaces= ns) is not None else "Unknown Zone"
-    path.append((fare_zone.tag, start_zone_id, zone_name))
-    print(f"Found FareZone for stop: {start_zone_id} - {zone_name}")
-
-    # Step 2  find anything containing ref to the zone in a farestructurelement and show the path back up to FSE
-    find_containing_fse(fare_zone)
-    
-    # Step 3: Find the first DistanceMatrixElement for this FareZone
-    # first try for case of a OD matrix
-    distance_matrix_element =  find_first_distance_matrix_element(start_zone_id)
-    if distance_matrix_element is None:
-        print("No DistanceMatrixElement found from the starting FareZone.")
-        quit()
-
-    # Get end zone and price
-    end_zone_ref = distance_matrix_element.find(".//netex:EndTariffZoneRef", namespaces= ns)
-    if end_zone_ref is None:
-        print("No end zone reference found in DistanceMatrixElement.")
+    if args.all_pairs:
+        with phase('all_pairs'):
+            prices, stop_ids, stop_index = all_pairs_price_matrix(tree, index)
+        count('stops', len(stop_ids))
+        print(f"Resolved {np.count_nonzero(~np.isnan(prices))} of {prices.size} stop pairs for {len(stop_ids)} stops")
+        with phase('export'):
+            if args.matrix_csv:
+                write_price_matrix_csv(args.matrix_csv, prices, stop_ids)
+            if args.matrix_npy:
+                write_price_matrix_npy(args.matrix_npy, prices, stop_ids)
         quit()
 
-    end_zone_id = end_zone_ref.get("ref")
-
-    # Add DistanceMatrixElement to path
-    path.append((distance_matrix_element.tag, distance_matrix_element.get("id"),f"Example To Zone ID: {end_zone_id}"))
-
-    price_group =  find_price_group_for_distance_matrix(distance_matrix_element)
-    
-    if price_group == "No price group":
-        print("No price_group found price_group.")
-        quit()
-    
-    # Add PriceGroup to path
-    path.append((price_group.tag, price_group.get("id"), ''))
+    with phase('trace'):
+        if start_stop_id is None:
+            # find a stop, any stop
+            start_stop_id = tree.find(".//netex:ScheduledStopPoint", namespaces= ns).get('id')
 
-    amount, price_holder_type, price_holder_id =  find_amount_for_price_group(price_group)
+        print(f"Starting traversal from stop ID: {start_stop_id}")
+        path, problem = trace_fare(index, start_stop_id, end_stop_id)
+        if path:
+            _, start_zone_id, zone_name = path[0]
+            print(f"Found FareZone for stop: {start_zone_id} - {zone_name}")
 
-    path.append((price_holder_type, price_holder_id,amount))
+            # find anything containing ref to the zone in a farestructurelement and show the path back up to FSE
+            find_containing_fse(find_by_id(index, start_zone_id, NETEX + 'FareZone'), index)
+        if problem:
+            print(problem)
+            quit()
 
     # Step 3: Output the trace path
     print("Trace Path:")